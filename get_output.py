@@ -8,13 +8,12 @@ def main():
 
     filter_key = sys.argv[1]
 
-    # List all files and directories in the current directory
-    ls = os.listdir()
-
-    # Filter based on the provided key, excluding those with 'dataset' in the name
-    output_arg = ' '.join(
-        list(filter(lambda x: filter_key in x and 'dataset' not in x, ls))
-    )
+    # Stream the files and directories in the current directory and filter them
+    # based on the provided key, excluding those with 'dataset' in the name
+    with os.scandir('.') as it:
+        output_arg = ' '.join(
+            e.name for e in it if filter_key in e.name and 'dataset' not in e.name
+        )
 
     # Print the filtered output
     print(output_arg)
@@ -0,0 +1,7 @@
+import sys
+import cloudpickle
+
+# Registering custom functions: the whole package is pickled by value, so that the custom
+# workflows, cuts and weights are shipped to the workers without installing mutag_calib.
+# Registering the top-level package covers all its submodules and is done once per interpreter.
+cloudpickle.register_pickle_by_value(sys.modules[__name__])
@@ -0,0 +1,9 @@
+# Bin edges shared by the histograms of the configs.
+# The edges are defined once and referenced by all the axes using them.
+# PocketCoffea requires the edges of a variable axis to be a list.
+TAU21_BINS = [0, 0.20, 0.25, 0.30, 0.35, 0.40, 0.45, 0.50, 0.55, 0.60, 0.65, 0.70, 0.75, 0.80, 1]
+TAU21_BINS_COARSE = [0, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 1]
+
+# Binning of the pt-eta(-tau21) reweighting
+PT_BINS_REWEIGHTING = [300., 320., 340., 360., 380., 400., 450., 500., 550., 600., 700., 800., 900., 2500.]
+ETA_BINS_REWEIGHTING = [-5, -2, -1.75, -1.5, -1.25, -1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2, 5]
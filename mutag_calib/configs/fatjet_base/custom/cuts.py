@@ -1,6 +1,8 @@
 # Per-event cuts applied to each event
+from itertools import product
 from pocket_coffea.lib.cut_definition import Cut
-from mutag_calib.configs.fatjet_base.custom.functions import twojets_ptmsd, mutag_fatjet, mutag_subjet, ptbin, ptbin_mutag, msoftdrop, msoftdropbin, ptmsd, ptmsd_window, ptmsdtau, min_nObj_minmsd, flavor_mask
+from pocket_coffea.lib.categorization import MultiCut
+from mutag_calib.configs.fatjet_base.custom.functions import twojets_ptmsd, mutag_fatjet, mutag_subjet, ptbin, ptbin_mutag, msoftdrop, msoftdropbin, ptmsd, ptmsd_window, ptmsdtau, min_nObj_minmsd, flavor_mask, get_inclusive_wp
 
 def twojets_presel(pt, msd, name=None):
     if name == None:
@@ -148,4 +150,32 @@ def get_flavor(flavor):
         function=flavor_mask,
         collection="FatJetGood"
     )
-    
\ No newline at end of file
+    
+
+# Flavor cuts shared by the subsamples of all the MC samples
+FLAVOR_CUTS = {f: [get_flavor(f)] for f in ['l', 'c', 'b', 'cc', 'bb']}
+
+def get_mutag_multicuts(taggers, wp_dict, pt_binning, msd_binning):
+    '''
+    Factory function which creates the MultiCut objects defining the categories of the fit templates,
+    i.e. the cartesian product of the bins in msd, the bins in pt and the pass/fail regions of the tagger WPs.
+    :param taggers: list of taggers
+    :param wp_dict: dictionary of the WPs of each tagger, {tagger : {wp : wp_value}}
+    :param pt_binning: list of (pt_low, pt_high) bins
+    :param msd_binning: list of (msd_low, msd_high) bins
+    :returns: list of MultiCut objects for msd, pt and tagger WPs
+    '''
+    tagger_regions = [(tagger, wp, wp_value, region)
+                      for tagger in taggers
+                      for (wp, wp_value), region in product(wp_dict[tagger].items(), ["pass", "fail"])]
+    return [
+        MultiCut(name="msd",
+                 cuts=[get_msdbin(msd_low, msd_high) for msd_low, msd_high in msd_binning],
+                 cuts_names=[f'msd-{msd_low}to{msd_high}' for msd_low, msd_high in msd_binning]),
+        MultiCut(name="pt",
+                 cuts=[get_ptbin(pt_low, pt_high) for pt_low, pt_high in pt_binning],
+                 cuts_names=[f'Pt-{pt_low}to{pt_high}' for pt_low, pt_high in pt_binning]),
+        MultiCut(name="tagger",
+                 cuts=[get_inclusive_wp(tagger, wp_value, region) for tagger, _, wp_value, region in tagger_regions],
+                 cuts_names=[f"{tagger}-{wp}-{region}" for tagger, wp, _, region in tagger_regions]),
+    ]
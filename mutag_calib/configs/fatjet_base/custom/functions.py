@@ -48,15 +48,19 @@ def tagger_mask_inclusive_wp(events, params, **kwargs):
     # assert (len(params["wp"]) == 2), "The 'wp' parameter has to be a 2D tuple"
     # cut_low, cut_high = params["wp"]
     assert (cut_low < cut_high), "The lower bound of the WP has to be smaller than the higher bound"
-    mask = (events.FatJetGood[params["tagger"]] > cut_low)
-
     assert (params["category"] in ["pass", "fail"]), "The allowed categories for the tagger selection are 'pass' and 'fail'"
-    if params["category"] == "fail":
-        mask = ~mask & (events.FatJetGood[params["tagger"]] >= 0) & (events.FatJetGood[params["tagger"]] <= 1)
 
-    assert not ak.any(ak.is_none(mask)), f"None in tagger_mask_inclusive_wp, \n{events.nJetGood[ak.is_none(mask)]}"
+    # The tagger score is read and flattened once, the mask is computed on the flat NumPy array
+    score = events.FatJetGood[params["tagger"]]
+    assert not ak.any(ak.is_none(score, axis=1)), f"None in tagger_mask_inclusive_wp, \n{events.nJetGood[ak.any(ak.is_none(score, axis=1), axis=1)]}"
+    nfatjet = ak.num(score)
+    score = ak.to_numpy(ak.flatten(score))
 
-    return mask
+    mask = score > cut_low
+    if params["category"] == "fail":
+        mask = ~mask & (score >= 0) & (score <= 1)
+
+    return ak.unflatten(mask, nfatjet)
 
 def get_tagger_pass(taggers, wp):
     return Cut(
@@ -128,7 +132,7 @@ def mutag_fatjet(events, params, **kwargs):
 
 def mutag_subjet(events, params, **kwargs):
     # Select jets with a minimum number of subjets
-    mask_nsubjet = (ak.count(events.FatJetGood.subjets.pt, axis=2) >= params["nsubjet"])
+    mask_nsubjet = (ak.num(events.FatJetGood.subjets, axis=2) >= params["nsubjet"])
     # Select jets with a minimum number of mu-tagged subjets
     if params["unique_matching"]:
         mask_nmusj = (events.FatJetGood.nMuonGoodMatchedUniquelyToSubJet >= params["nmuons"])
@@ -163,7 +167,7 @@ def msoftdrop(events, params, **kwargs):
     
     assert not ak.any(ak.is_none(mask), axis=1), f"None in ptmsd\n{events.FatJetGood.pt[ak.is_none(mask, axis=1)]}"
 
-    return ak.where(~ak.is_none(mask, axis=1), mask, False)
+    return ak.fill_none(mask, False)
 
 def msoftdropbin(events, params, **kwargs):
     # Mask to select events with a fatjet with minimum softdrop mass and maximum
@@ -176,7 +180,7 @@ def msoftdropbin(events, params, **kwargs):
 
     assert not ak.any(ak.is_none(mask, axis=1)), f"None in msoftdropbin\n{events.nJetGood[ak.is_none(mask, axis=1)]}"
 
-    return ak.where(~ak.is_none(mask, axis=1), mask, False)
+    return ak.fill_none(mask, False)
 
 def ptmsd(events, params, **kwargs):
     # Mask to select events with a fatjet with minimum softdrop mass and maximum tau21
@@ -185,7 +189,7 @@ def ptmsd(events, params, **kwargs):
 
     assert not ak.any(ak.is_none(mask, axis=1)), f"None in ptmsd\n{events.FatJetGood.pt[ak.is_none(mask, axis=1)]}"
 
-    return ak.where(~ak.is_none(mask, axis=1), mask, False)
+    return ak.fill_none(mask, False)
 
 def ptmsd_window(events, params, **kwargs):
     # Mask to select events with a fatjet with minimum softdrop mass and maximum softdrop mass
@@ -193,7 +197,7 @@ def ptmsd_window(events, params, **kwargs):
 
     assert not ak.any(ak.is_none(mask, axis=1)), f"None in ptmsd_window\n{events.FatJetGood.pt[ak.is_none(mask, axis=1)]}"
 
-    return ak.where(~ak.is_none(mask, axis=1), mask, False)
+    return ak.fill_none(mask, False)
 
 
 def ptmsdtau(events, params, **kwargs):
@@ -202,7 +206,7 @@ def ptmsdtau(events, params, **kwargs):
 
     assert not ak.any(ak.is_none(mask, axis=1)), f"None in ptmsdtau\n{events.FatJetGood.pt[ak.is_none(mask, axis=1)]}"
 
-    return ak.where(~ak.is_none(mask, axis=1), mask, False)
+    return ak.fill_none(mask, False)
 
 def ptmsdtauDDCvB(events, params, **kwargs):
     # Mask to select events with a fatjet with minimum softdrop mass and maximum tau21 and a requirement on the DDCvB score
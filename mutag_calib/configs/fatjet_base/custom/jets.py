@@ -1,15 +1,19 @@
-import copy
+import math
 import importlib
 import gzip
 import cloudpickle
 
 import awkward as ak
 import numpy as np
+import numba as nb
 import correctionlib
 
 from pocket_coffea.parameters.object_preselection import object_preselection
 from pocket_coffea.parameters.jec_config import JECjsonFiles
 
+from mutag_calib.lib.kernels import delta_r2, offsets
+from mutag_calib.lib import jets as lib_jets
+
 # Initialization of the jet factory
 with importlib.resources.path("pocket_coffea.parameters.jec", "jets_evaluator.pkl.gz") as path:
     with gzip.open(path) as fin:
@@ -20,10 +24,18 @@ fatjet_factory = jmestuff["fatjet_factory"]
 met_factory = jmestuff["met_factory"]
 
 def add_jec_variables(jets, event_rho):
-    jets["pt_raw"] = (1 - jets.rawFactor)*jets.pt
-    jets["mass_raw"] = (1 - jets.rawFactor)*jets.mass
-    jets["pt_gen"] = ak.values_astype(ak.fill_none(jets.matched_gen.pt, 0), np.float32)
-    jets["event_rho"] = ak.broadcast_arrays(event_rho, jets.pt)[0]
+    # The new columns are computed on the flat NumPy buffers and unflattened once with the same counts
+    nj = ak.num(jets)
+    j = ak.flatten(jets)
+    raw = 1 - ak.to_numpy(j.rawFactor)
+    jec_variables = {
+        "pt_raw" : raw * ak.to_numpy(j.pt),
+        "mass_raw" : raw * ak.to_numpy(j.mass),
+        "pt_gen" : ak.to_numpy(ak.fill_none(j.matched_gen.pt, 0)).astype(np.float32),
+        "event_rho" : np.repeat(ak.to_numpy(event_rho), ak.to_numpy(nj)),
+    }
+    for field, value in jec_variables.items():
+        jets[field] = ak.unflatten(value, nj)
     return jets
 
 
@@ -41,6 +53,22 @@ def jet_correction(events, jets, jetType, year, cache, applyJER=True):
         )
 
 
+@nb.njit(cache=True, fastmath=True, parallel=True)
+def _jer_smear(pt, gen_pt, matched, sf, res, rand):
+    '''JER smearing factor with the hybrid method, computed on flat arrays of jets.
+    Jets matched to a gen-jet within 3 sigmas of the pt resolution are smeared with the scaling method,
+    all the other jets are smeared with the stochastic method, where `rand` is a gaussian random number
+    with standard deviation equal to the pt resolution.'''
+    out = np.empty_like(pt)
+    for i in nb.prange(pt.size):
+        if matched[i] and abs(pt[i] - gen_pt[i]) < 3 * res[i] * pt[i]:
+            out[i] = 1.0 + (sf[i] - 1.0) * (pt[i] - gen_pt[i]) / pt[i]
+        else:
+            s = sf[i] * sf[i] - 1.0
+            out[i] = 1.0 + rand[i] * math.sqrt(s) if s > 0 else 1.0
+    return out
+
+
 def jet_correction_correctionlib(
     events, Jet, typeJet, year, JECversion, JERversion=None, verbose=False
 ):
@@ -56,24 +84,35 @@ def jet_correction_correctionlib(
     JECfile = correctionlib.CorrectionSet.from_file(jsonfile)
     corr = JECfile.compound[f'{JECversion}_L1L2L3Res_{typeJet}']
 
-    # until correctionlib handles jagged data natively we have to flatten and unflatten
+    # until correctionlib handles jagged data natively we have to flatten and unflatten.
+    # The jet collection is flattened only once: the flat NumPy columns are shared
+    # between the JEC and JER evaluations and the counts are reused for every unflatten.
     jets = events[Jet]
-    jets['pt_raw'] = (1 - jets['rawFactor']) * jets['pt']
-    jets['mass_raw'] = (1 - jets['rawFactor']) * jets['mass']
-    jets['rho'] = ak.broadcast_arrays(events.fixedGridRhoFastjetAll, jets.pt)[0]
-    j, nj = ak.flatten(jets), ak.num(jets)
+    nj = ak.num(jets)
+    j = ak.flatten(jets)
+    rawFactor_flat = ak.to_numpy(j['rawFactor'])
+    eta_flat = ak.to_numpy(j['eta'])
+    pt_raw_flat = (1 - rawFactor_flat) * ak.to_numpy(j['pt'])
+    mass_raw_flat = (1 - rawFactor_flat) * ak.to_numpy(j['mass'])
+    rho_flat = np.repeat(ak.to_numpy(events.fixedGridRhoFastjetAll), ak.to_numpy(nj))
     flatCorrFactor = corr.evaluate(
-        np.array(j['area']),
-        np.array(j['eta']),
-        np.array(j['pt_raw']),
-        np.array(j['rho']),
+        ak.to_numpy(j['area']),
+        eta_flat,
+        pt_raw_flat,
+        rho_flat,
+    ).astype(np.float32, copy=False)
+    # N.B.: all the flat columns are kept in float32 as in NanoAOD
+    pt_flat = pt_raw_flat * flatCorrFactor
+    mass_flat = mass_raw_flat * flatCorrFactor
+
+    jets['pt_raw'] = ak.unflatten(pt_raw_flat, nj)
+    jets['mass_raw'] = ak.unflatten(mass_raw_flat, nj)
+
+    jets_corrected = ak.with_field(
+        ak.with_field(jets, ak.unflatten(pt_flat, nj), 'pt'),
+        ak.unflatten(mass_flat, nj),
+        'mass',
     )
-    corrFactor = ak.unflatten(flatCorrFactor, nj)
-
-    jets_corrected = copy.copy(jets)
-    jets_corrected['pt'] = jets['pt_raw'] * corrFactor
-    jets_corrected['mass'] = jets['mass_raw'] * corrFactor
-    jets_corrected['rho'] = jets['rho']
 
     seed = events.event[0]
 
@@ -105,20 +144,13 @@ def jet_correction_correctionlib(
     if JERversion:
         sf = JECfile[f'{JERversion}_ScaleFactor_{typeJet}']
         res = JECfile[f'{JERversion}_PtResolution_{typeJet}']
-        j, nj = ak.flatten(jets_corrected), ak.num(jets_corrected)
-        scaleFactor_flat = sf.evaluate(j['eta'].to_numpy(), 'nom')
-        ptResolution_flat = res.evaluate(
-            j['eta'].to_numpy(), j['pt'].to_numpy(), j['rho'].to_numpy()
-        )
-        scaleFactor = ak.unflatten(scaleFactor_flat, nj)
-        ptResolution = ak.unflatten(ptResolution_flat, nj)
+        scaleFactor_flat = sf.evaluate(eta_flat, 'nom').astype(np.float32, copy=False)
+        ptResolution_flat = res.evaluate(eta_flat, pt_flat, rho_flat).astype(np.float32, copy=False)
         # Match jets with gen-level jets, with DeltaR and DeltaPt requirements
         dr_min = {'AK4PFchs': 0.2, 'AK8PFPuppi': 0.4}[
             typeJet
         ]  # Match jets within a cone with half the jet radius
-        pt_min = (
-            3 * ptResolution * jets_corrected['pt']
-        )  # Match jets whose pt does not differ more than 3 sigmas from the gen-level pt
+        # N.B.: the DeltaPt requirement (3 sigmas from the gen-level pt) is applied inside `_jer_smear`
         genJet    = {'AK4PFchs': 'GenJet', 'AK8PFPuppi': 'GenJetAK8'}[typeJet]
         genJetIdx = {'AK4PFchs': 'genJetIdx', 'AK8PFPuppi': 'genJetAK8Idx'}[typeJet]
 
@@ -128,58 +160,42 @@ def jet_correction_correctionlib(
         # not all the genJet are saved in the NanoAODs.
         genjets = events[genJet]
         Ngenjet = ak.num(genjets)
-        matched_genjets_idx = ak.mask(
-            jets_corrected[genJetIdx],
-            (jets_corrected[genJetIdx] < Ngenjet) & (jets_corrected[genJetIdx] != -1),
-        )
         # this array of indices has already the dimension of the Jet collection
         # in NanoAOD nomatch == -1 --> convert to None with a mask
-        matched_objs_mask = ~ak.is_none(matched_genjets_idx, axis=1)
-        matched_genjets = genjets[matched_genjets_idx]
-        matched_jets = ak.mask(jets_corrected, matched_objs_mask)
+        matched_objs_mask = (jets_corrected[genJetIdx] < Ngenjet) & (jets_corrected[genJetIdx] != -1)
+        matched_genjets = genjets[ak.mask(jets_corrected[genJetIdx], matched_objs_mask)]
+        matched_flat = ak.to_numpy(ak.flatten(matched_objs_mask))
+        genpt_flat = ak.to_numpy(ak.flatten(ak.fill_none(matched_genjets.pt, 0.0)))
 
-        deltaPt = ak.unflatten(
-            np.abs(ak.flatten(matched_jets.pt) - ak.flatten(matched_genjets.pt)),
-            ak.num(matched_genjets),
-        )
-        matched_genjets = ak.mask(matched_genjets, deltaPt < pt_min)
-        matched_jets = ak.mask(matched_jets, deltaPt < pt_min)
-
-        # Compute energy correction factor with the scaling method
-        detSmear = (
-            1
-            + (scaleFactor - 1)
-            * (matched_jets['pt'] - matched_genjets['pt'])
-            / matched_jets['pt']
-        )
         # Compute energy correction factor with the stochastic method
-        np.random.seed(seed)
+        rng = np.random.default_rng(seed)
         seed_dict = {}
         filename = events.metadata['filename']
         entrystart = events.metadata['entrystart']
         entrystop = events.metadata['entrystop']
         seed_dict[f'chunk_{filename}_{entrystart}-{entrystop}'] = seed
-        rand_gaus = np.random.normal(
-            np.zeros_like(ptResolution_flat), ptResolution_flat
-        )
-        jersmear = ak.unflatten(rand_gaus, nj)
-        sqrt_arg_flat = scaleFactor_flat**2 - 1
-        sqrt_arg_flat = ak.where(
-            sqrt_arg_flat > 0, sqrt_arg_flat, ak.zeros_like(sqrt_arg_flat)
+        rand_gaus = np.empty_like(ptResolution_flat)
+        rng.standard_normal(dtype=np.float32, out=rand_gaus)
+        rand_gaus *= ptResolution_flat
+        # Hybrid method: scaling for gen-matched jets, stochastic smearing otherwise
+        smearFactor_flat = _jer_smear(
+            pt_flat, genpt_flat, matched_flat, scaleFactor_flat, ptResolution_flat, rand_gaus
         )
-        sqrt_arg = ak.unflatten(sqrt_arg_flat, nj)
-        stochSmear = 1 + jersmear * np.sqrt(sqrt_arg)
-        isMatched = ~ak.is_none(matched_jets.pt, axis=1)
-        smearFactor = ak.where(isMatched, detSmear, stochSmear)
+        smearFactor = ak.unflatten(smearFactor_flat, nj)
 
-        jets_smeared = copy.copy(jets_corrected)
-        jets_smeared['pt'] = jets_corrected['pt'] * smearFactor
-        jets_smeared['mass'] = jets_corrected['mass'] * smearFactor
+        jets_smeared = ak.with_field(
+            ak.with_field(jets_corrected, ak.unflatten(pt_flat * smearFactor_flat, nj), 'pt'),
+            ak.unflatten(mass_flat * smearFactor_flat, nj),
+            'mass',
+        )
 
         if verbose:
+            isMatched = ak.unflatten(
+                matched_flat & (np.abs(pt_flat - genpt_flat) < 3 * ptResolution_flat * pt_flat), nj
+            )
             print()
             print(seed, "JER: isMatched", isMatched)
-            print(seed, "JER: matched_jets.pt", matched_jets.pt)
+            print(seed, "JER: matched_genjets.pt", matched_genjets.pt)
             print(seed, "JER: smearFactor", smearFactor, end='\n\n')
 
             print(
@@ -208,58 +224,82 @@ def jet_correction_correctionlib(
         return jets_corrected
 
 
+@nb.njit(cache=True, parallel=True)
+def _jet_selection_mask(offsets_j, pt_j, eta_j, phi_j, jetId_j, extra_j,
+                        offsets_l, eta_l, phi_l,
+                        pt_cut, eta_cut, jetId_cut, dr2_cut, out):
+    '''Fill the flat mask `out` of the jets passing the pt, eta, jetId and the
+    jet-type specific (`extra_j`) requirements and, if `dr2_cut` > 0, separated
+    by more than sqrt(dr2_cut) from all the leptons of the same event.'''
+    for e in nb.prange(offsets_j.size - 1):
+        for j in range(offsets_j[e], offsets_j[e+1]):
+            keep = (
+                extra_j[j]
+                and pt_j[j] > pt_cut
+                and abs(eta_j[j]) < eta_cut
+                and jetId_j[j] >= jetId_cut
+            )
+            if keep and dr2_cut > 0:
+                for l in range(offsets_l[e], offsets_l[e+1]):
+                    if delta_r2(eta_j[j], phi_j[j], eta_l[l], phi_l[l]) <= dr2_cut:
+                        keep = False
+                        break
+            out[j] = keep
+
+
 def jet_selection(events, Jet, finalstate):
 
     jets = events[Jet]
+    # Resolve the cut values once, outside of the per-jet computations
     cuts = object_preselection[finalstate][Jet]
-    # Only jets that are more distant than dr to ALL leptons are tagged as good jets
-    leptons = events["LeptonGood"]
-    # Mask for  jets not passing the preselection
-    mask_presel = (
-        (jets.pt > cuts["pt"])
-        & (np.abs(jets.eta) < cuts["eta"])
-        & (jets.jetId >= cuts["jetId"])
-    )
-    # Lepton cleaning
-    if "dr" in cuts.keys():
-        dR_jets_lep = jets.metric_table(leptons)
-        mask_lepton_cleaning = ak.prod(dR_jets_lep > cuts["dr"], axis=2) == 1
+    pt_cut, eta_cut, jetId_cut = cuts["pt"], cuts["eta"], cuts["jetId"]
+    nj = ak.num(jets)
+    j = ak.flatten(jets)
+    pt_flat = ak.to_numpy(j.pt)
 
     if Jet == "Jet":
-        mask_jetpuid = (jets.puId >= cuts["puId"]["value"]) | (
-            jets.pt >= cuts["puId"]["maxpt"]
-        )
-        mask_good_jets = mask_presel & mask_lepton_cleaning & mask_jetpuid
+        puId_cut, puId_maxpt = cuts["puId"]["value"], cuts["puId"]["maxpt"]
+        dr2_cut = cuts["dr"]**2
+        # Jet pileup ID, applied only below a maximum pt
+        mask_extra = (ak.to_numpy(j.puId) >= puId_cut) | (pt_flat >= puId_maxpt)
+        # Lepton cleaning: only jets that are more distant than dr to ALL leptons are tagged as good jets
+        leptons = events["LeptonGood"]
+        nl = ak.num(leptons)
+        l = ak.flatten(leptons)
+        eta_l, phi_l = ak.to_numpy(l.eta), ak.to_numpy(l.phi)
 
     elif Jet == "FatJet":
+        msd_cut = cuts["msd"]
         # Define the number of muons inside the subjet
         #mask_nsubjets = ak.num(events.FatJet.subjets, axis=2) >= 2
         # Apply the msd and preselection cuts
-        mask_msd = (events.FatJet.msoftdrop > cuts["msd"])
-        mask_good_jets = mask_presel & mask_msd
+        mask_extra = ak.to_numpy(j.msoftdrop) > msd_cut
         #mask_good_jets = mask_presel & mask_nsubjets & mask_msd
+        # No lepton cleaning is applied to the fatjets
+        nl = np.zeros(len(nj), dtype=np.int64)
+        eta_l = phi_l = np.zeros(0)
+        dr2_cut = -1.0
+
+    mask_flat = np.empty(len(pt_flat), dtype=bool)
+    _jet_selection_mask(
+        offsets(ak.to_numpy(nj)), pt_flat, ak.to_numpy(j.eta), ak.to_numpy(j.phi),
+        ak.to_numpy(j.jetId), mask_extra,
+        offsets(ak.to_numpy(nl)), eta_l, phi_l,
+        pt_cut, eta_cut, jetId_cut, dr2_cut, mask_flat
+    )
+    mask_good_jets = ak.unflatten(mask_flat, nj)
 
     return jets[mask_good_jets], mask_good_jets
 
 def jet_mutag_selection(events, Jet, finalstate):
 
-    jets = events[Jet]
-    cuts = object_preselection[finalstate][Jet]
-
-    if Jet == "FatJet":
-        njet_max = ak.max(ak.count(jets.pt, axis=1))
-        # Select jets with a minimum number of subjets
-        mask_nsubjet = (ak.count(jets.subjets.pt, axis=2) >= cuts["nsubjet"])
-        # Select jets with a minimum number of mu-tagged subjets
-        mask_nmusj = (nmusj >= cuts["nmusj"])
-        # Apply di-muon pT ratio cut on FatJets
-        mask_ptratio = (events.dimuon.pt / events.FatJet.pt < cuts["dimuon_pt_ratio"])
-        mask_ptratio = ak.where( ak.is_none(mask_ptratio), ak.zeros_like(events.FatJet.pt, dtype=bool), mask_ptratio )
-        for mask in [mask_nsubjet, mask_nmusj, mask_ptratio]:
-            mask_good_jets = mask_good_jets & ak.pad_none(mask, njet_max)
-        mask_good_jets = mask[~ak.is_none(mask, axis=1)]
-
-    return jets[mask_good_jets], mask_good_jets
+    return lib_jets.jet_mutag_selection(events, Jet, finalstate)
 
 def btagging(Jet, btag):
-    return Jet[Jet[btag["btagging_algorithm"]] > btag["btagging_WP"]]
+    # The b-tagging mask is elementwise: it is evaluated on the flat jets and the
+    # number of selected jets per event is obtained from the cumulative sum of the mask
+    flat_jets = ak.flatten(Jet)
+    mask = ak.to_numpy(flat_jets[btag["btagging_algorithm"]]) > btag["btagging_WP"]
+    jet_offsets = offsets(ak.to_numpy(ak.num(Jet)))
+    cumsum = np.concatenate(([0], np.cumsum(mask)))
+    return ak.unflatten(flat_jets[mask], cumsum[jet_offsets[1:]] - cumsum[jet_offsets[:-1]])
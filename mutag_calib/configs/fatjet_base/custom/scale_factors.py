@@ -1,61 +1,94 @@
+import os
+
+import numpy as np
 import awkward as ak
 
 import correctionlib
 
 #from mutag_calib.configs.fatjet_base.custom.parameters.pt_reweighting.pt_reweighting import pt_corrections, pteta_corrections
 
+# The caches are plain dictionaries keyed by the path and the modification time of the file,
+# so that a correction file regenerated during the lifetime of a worker is loaded again.
+# N.B.: the package is pickled by value, a functools.lru_cache wrapper would be pickled by reference instead
+_CSET_CACHE = {}
+_CORRECTOR_CACHE = {}
+
+def load_correction_set(path):
+    '''Load a correctionlib CorrectionSet from file only once per process, unless the file is modified.'''
+    key = (path, os.path.getmtime(path))
+    if key not in _CSET_CACHE:
+        _CSET_CACHE[key] = correctionlib.CorrectionSet.from_file(path)
+    return _CSET_CACHE[key]
+
+def get_corrector(path, key=None):
+    '''Return the corrector `key` of the CorrectionSet stored in `path`.
+    If `key` is None, the first correction of the set is returned.'''
+    cache_key = (path, os.path.getmtime(path), key)
+    if cache_key not in _CORRECTOR_CACHE:
+        cset = load_correction_set(path)
+        _CORRECTOR_CACHE[cache_key] = cset[key if key is not None else list(cset.keys())[0]]
+    return _CORRECTOR_CACHE[cache_key]
+
 def pt_reweighting(events, year):
     '''Reweighting scale factor based on the leading fatjet pT'''
     cat = 'pt350msd40'
-    cset = correctionlib.CorrectionSet.from_file(pt_corrections[year])
-    pt_corr = cset[f'pt_corr_{year}']
+    pt_corr = get_corrector(pt_corrections[year], f'pt_corr_{year}')
 
     '''In case the jet pt is higher than 1500 GeV, the pt is padded to 0
     and a correction SF of 1 is returned.'''
-    pt = events.FatJetGood.pt[:,0]
-    pt = ak.where(pt < 1500, pt, 0)
+    pt = ak.to_numpy(events.FatJetGood.pt[:,0])
+    pt = np.where(pt < 1500, pt, 0)
 
     return pt_corr.evaluate(cat, pt)
 
 def pteta_reweighting(events, year):
     '''Reweighting scale factor based on the leading fatjet pT'''
     cat = 'pt350msd40'
-    cset = correctionlib.CorrectionSet.from_file(pteta_corrections[year])
-    pteta_corr = cset[f'pt_eta_2D_corr_{year}']
+    pteta_corr = get_corrector(pteta_corrections[year], f'pt_eta_2D_corr_{year}')
 
     '''In case the jet pt is higher than 1500 GeV, the pt is padded to 0
     and a correction SF of 1 is returned.'''
-    pt  = events.FatJetGood.pt[:,0]
-    eta = events.FatJetGood.eta[:,0]
-    pt = ak.where(pt < 1500, pt, 0)
+    pt  = ak.to_numpy(events.FatJetGood.pt[:,0])
+    eta = ak.to_numpy(events.FatJetGood.eta[:,0])
+    pt = np.where(pt < 1500, pt, 0)
 
     return pteta_corr.evaluate(cat, pt, eta)
 
 def sf_trigger_prescale(events, year, params):
     '''Trigger prescale factor'''
     # Here we assume that both BTagMu_AK4Jet300_Mu5 and BTagMu_AK8Jet170_DoubleMu5 triggers have a prescale of 1
-    sf = ak.Array(len(events)*[1.0])
-    pass_unprescaled_triggers = events.HLT["BTagMu_AK4Jet300_Mu5"] | events.HLT["BTagMu_AK8Jet170_DoubleMu5"]
-    sf = ak.where(events.HLT["BTagMu_AK8Jet300_Mu5"] & (~pass_unprescaled_triggers), 1. / params["HLT_triggers_prescales"][year]["BTagMu"]["BTagMu_AK8Jet300_Mu5"], sf)
-    sf = ak.where(events.HLT["BTagMu_AK8DiJet170_Mu5"] & (~events.HLT["BTagMu_AK8Jet300_Mu5"]) & (~pass_unprescaled_triggers), 1. / params["HLT_triggers_prescales"][year]["BTagMu"]["BTagMu_AK8DiJet170_Mu5"], sf)
-
-    return sf
+    prescales = params["HLT_triggers_prescales"][year]["BTagMu"]
+    pass_unprescaled_triggers = ak.to_numpy(events.HLT["BTagMu_AK4Jet300_Mu5"] | events.HLT["BTagMu_AK8Jet170_DoubleMu5"])
+    pass_AK8Jet300 = ak.to_numpy(events.HLT["BTagMu_AK8Jet300_Mu5"])
+    pass_AK8DiJet170 = ak.to_numpy(events.HLT["BTagMu_AK8DiJet170_Mu5"])
+
+    # Encode the trigger decisions in a 3-bit code and look up the prescale factor in a table,
+    # where the triggers have priority: unprescaled > BTagMu_AK8Jet300_Mu5 > BTagMu_AK8DiJet170_Mu5
+    code = (
+        pass_unprescaled_triggers.view(np.uint8)
+        | (pass_AK8Jet300.view(np.uint8) << 1)
+        | (pass_AK8DiJet170.view(np.uint8) << 2)
+    )
+    table = np.ones(8)
+    table[[0b010, 0b110]] = 1. / prescales["BTagMu_AK8Jet300_Mu5"]
+    table[0b100] = 1. / prescales["BTagMu_AK8DiJet170_Mu5"]
+
+    return ak.Array(table[code])
 
 def sf_ptetatau21_reweighting(events, year, params):
     '''Correction of jets observable by a 3D reweighting based on (pT, eta, tau21).
     The function returns the nominal, up and down weights, where the up/down variations are computed considering the statistical uncertainty on data and MC.'''
 
-
-    cset = correctionlib.CorrectionSet.from_file(params["ptetatau21_reweighting"][year])
-    key = list(cset.keys())[0]
-    corr = cset[key]
+    corr = get_corrector(params["ptetatau21_reweighting"][year])
 
     cat = "inclusive"
     nfatjet  = ak.num(events.FatJetGood.pt)
-    pos = ak.flatten(ak.local_index(events.FatJetGood.pt))
-    pt = ak.flatten(events.FatJetGood.pt)
-    eta = ak.flatten(events.FatJetGood.eta)
-    tau21 = ak.flatten(events.FatJetGood.tau21)
+    # The inputs are converted to NumPy only once and shared between the three variations,
+    # since correctionlib does not accept arrays of strings for the variation axis
+    pos = ak.to_numpy(ak.flatten(ak.local_index(events.FatJetGood.pt)))
+    pt = ak.to_numpy(ak.flatten(events.FatJetGood.pt))
+    eta = ak.to_numpy(ak.flatten(events.FatJetGood.eta))
+    tau21 = ak.to_numpy(ak.flatten(events.FatJetGood.tau21))
 
     weight = {}
     for var in ["nominal", "statUp", "statDown"]:
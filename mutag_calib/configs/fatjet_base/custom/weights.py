@@ -1,4 +1,5 @@
 from pocket_coffea.lib.weights.weights import WeightLambda
+from pocket_coffea.lib.weights.common.common import common_weights
 from mutag_calib.configs.fatjet_base.custom.scale_factors import pt_reweighting, pteta_reweighting, sf_ptetatau21_reweighting, sf_trigger_prescale
 
 pt_weight = WeightLambda.wrap_func(
@@ -24,3 +25,6 @@ SF_ptetatau21_reweighting = WeightLambda.wrap_func(
         sf_ptetatau21_reweighting(events, metadata['year'], params),
     has_variations=True
 )
+
+# Weight classes of the mutag configs, composed once at import
+MUTAG_WEIGHTS = tuple(common_weights) + (SF_trigger_prescale,)
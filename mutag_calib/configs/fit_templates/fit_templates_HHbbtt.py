@@ -1,17 +1,13 @@
 from pocket_coffea.utils.configurator import Configurator
-from pocket_coffea.lib.cut_definition import Cut
-from pocket_coffea.lib.cut_functions import get_nObj_eq, get_nObj_min, get_HLTsel, get_nPVgood, goldenJson, eventFlags
+from pocket_coffea.lib.cut_functions import get_nObj_min, get_HLTsel, get_nPVgood, goldenJson, eventFlags
 from pocket_coffea.parameters.cuts import passthrough
-from pocket_coffea.lib.categorization import CartesianSelection, MultiCut
+from pocket_coffea.lib.categorization import CartesianSelection
 
 from pocket_coffea.lib.calibrators.common.common import JetsCalibrator, JetsSoftdropMassCalibrator
-from pocket_coffea.lib.weights.common.common import common_weights
 from pocket_coffea.parameters.histograms import *
-import mutag_calib
-from mutag_calib.configs.fatjet_base.custom.cuts import get_ptmsd, get_ptmsd_window, get_nObj_minmsd, get_flavor, get_ptbin, get_msdbin
-from mutag_calib.configs.fatjet_base.custom.functions import get_inclusive_wp
-from mutag_calib.configs.fatjet_base.custom.weights import SF_trigger_prescale
-import mutag_calib.workflows.mutag_oneMuAK8_processor as workflow
+from mutag_calib.configs.fatjet_base.custom.cuts import get_ptmsd, get_ptmsd_window, get_nObj_minmsd, FLAVOR_CUTS, get_mutag_multicuts
+from mutag_calib.configs.binning import TAU21_BINS
+from mutag_calib.configs.fatjet_base.custom.weights import MUTAG_WEIGHTS
 from mutag_calib.workflows.mutag_oneMuAK8_processor import mutagAnalysisOneMuonInAK8Processor
 import os
 
@@ -19,18 +15,16 @@ localdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Loading default parameters
 from pocket_coffea.parameters import defaults
-default_parameters = defaults.get_default_parameters()
+from mutag_calib.configs.parameters import load_parameters
 defaults.register_configuration_dir("config_dir", localdir+"/params")
 
-parameters = defaults.merge_parameters_from_files(default_parameters,
-                                                f"{localdir}/params/object_preselection.yaml",
-                                                f"{localdir}/params/jets_calibration.yaml",
-                                                f"{localdir}/params/triggers_run3.yaml",
-                                                f"{localdir}/params/triggers_prescales_run3.yaml",
-                                                f"{localdir}/params/ptetatau21_reweighting_HHbbtt.yaml",
-                                                f"{localdir}/params/mutag_calibration_HHbbtt.yaml",
-                                                f"{localdir}/params/plotting_style.yaml",
-                                                update=True)
+parameters = load_parameters(f"{localdir}/params/object_preselection.yaml",
+                             f"{localdir}/params/jets_calibration.yaml",
+                             f"{localdir}/params/triggers_run3.yaml",
+                             f"{localdir}/params/triggers_prescales_run3.yaml",
+                             f"{localdir}/params/ptetatau21_reweighting_HHbbtt.yaml",
+                             f"{localdir}/params/mutag_calibration_HHbbtt.yaml",
+                             f"{localdir}/params/plotting_style.yaml")
 
 samples = [
     "QCD_MuEnriched",
@@ -41,9 +35,8 @@ samples = [
     "DATA_BTagMu"
 ]
 
-subsamples = {}
-for s in filter(lambda x: 'DATA_BTagMu' not in x, samples):
-    subsamples[s] = {f"{s}_{f}" : [get_flavor(f)] for f in ['l', 'c', 'b', 'cc', 'bb']}
+subsamples = {s : {f"{s}_{f}" : cut for f, cut in FLAVOR_CUTS.items()}
+              for s in samples if 'DATA_BTagMu' not in s}
 
 variables = {
     #**count_hist(name="nFatJetGood", coll="FatJetGood",bins=10, start=0, stop=10),
@@ -59,24 +52,23 @@ collections = ["FatJetGood"]
 for coll in collections:
     variables.update(**fatjet_hists(coll=coll))
     variables[f"{coll}_pt"] = HistConf([Axis(name=f"{coll}_pt", coll=coll, field="pt",
-                                                    label=r"FatJet $p_{T}$ [GeV]", bins=list(range(300, 1010, 10)))]
+                                                    label=r"FatJet $p_{T}$ [GeV]", bins=70, start=300, stop=1000)]
     )
     variables[f"{coll}_msoftdrop"] = HistConf([Axis(name=f"{coll}_msoftdrop", coll=coll, field="msoftdrop",
-                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=list(range(0, 410, 10)))]
+                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=40, start=0, stop=400)]
     )
     variables[f"{coll}_msoftdrop_raw"] = HistConf([Axis(name=f"{coll}_msoftdrop_raw", coll=coll, field="msoftdrop_raw",
-                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=list(range(0, 410, 10)))]
+                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=40, start=0, stop=400)]
     )
     variables[f"{coll}_tau21"] = HistConf([Axis(name=f"{coll}_tau21", coll=coll, field="tau21",
-                                                           label=r"FatJet $\tau_{21}$", bins=[0, 0.20, 0.25, 0.30, 0.35, 
-                                                           0.40, 0.45, 0.50, 0.55, 0.60, 0.65, 0.70, 0.75, 0.80, 1])]
+                                                           label=r"FatJet $\tau_{21}$", bins=TAU21_BINS)]
     )
     variables[f"{coll}_logsumcorrSVmass"] = HistConf(
         [ Axis(coll="FatJetGood", field="logsumcorrSVmass", label=r"log($\sum({m^{corr}_{SV}})$)", bins=42, start=-2.4, stop=6) ]
     )
     variables[f"{coll}_logsumcorrSVmass_tau21"] = HistConf(
         [ Axis(coll="FatJetGood", field="logsumcorrSVmass", label=r"log($\sum({m^{corr}_{SV}})$)", bins=42, start=-2.4, stop=6),
-          Axis(coll="FatJetGood", field="tau21", label=r"$\tau_{21}$", type="variable", bins=[0, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 1]) ]
+          Axis(coll="FatJetGood", field="tau21", label=r"$\tau_{21}$", type="variable", bins=TAU21_BINS) ]
     )
 
 # Build dictionary of workflow options
@@ -107,41 +99,8 @@ common_cats = {
     "pt300msd80to170" : [get_ptmsd_window(300., 80., 170.)],
 }
 
-# Define cuts to select bins in pt
-cuts_pt = []
-cuts_names_pt = []
-for pt_low, pt_high in pt_binning:
-    cuts_pt.append(get_ptbin(pt_low, pt_high))
-    cuts_names_pt.append(f'Pt-{pt_low}to{pt_high}')
-
-# Define cuts to select bins in msoftdrop
-cuts_msd = []
-cuts_names_msd = []
-for msd_low, msd_high in msd_binning:
-    cuts_msd.append(get_msdbin(msd_low, msd_high))
-    cuts_names_msd.append(f'msd-{msd_low}to{msd_high}')
-
-# Define cuts to select bins in tagger WPs
-cuts_tagger = []
-cuts_names_tagger = []
-for tagger in taggers:
-    for wp, wp_value in wp_dict[tagger].items():
-        for region in ["pass", "fail"]:
-            cuts_tagger.append(get_inclusive_wp(tagger, wp_value, region))
-            cuts_names_tagger.append(f"{tagger}-{wp}-{region}")
-
-# Define multicuts for pt, msd and tagger WPs
-multicuts = [
-    MultiCut(name="msd",
-             cuts=cuts_msd,
-             cuts_names=cuts_names_msd),
-    MultiCut(name="pt",
-             cuts=cuts_pt,
-             cuts_names=cuts_names_pt),
-    MultiCut(name="tagger",
-             cuts=cuts_tagger,
-             cuts_names=cuts_names_tagger),
-]
+# Define multicuts for msd, pt and tagger WPs
+multicuts = get_mutag_multicuts(taggers, wp_dict, pt_binning, msd_binning)
 
 cfg = Configurator(
     parameters = parameters,
@@ -180,7 +139,7 @@ cfg = Configurator(
     preselections = [get_nObj_min(1, parameters.object_preselection["FatJet"]["pt"], "FatJetGood")],
     categories = CartesianSelection(multicuts=multicuts, common_cats=common_cats),
 
-    weights_classes = common_weights + [SF_trigger_prescale],
+    weights_classes = MUTAG_WEIGHTS,
     weights = {
         "common": {
             "inclusive": ["genWeight","lumi","XS","sf_trigger_prescale",
@@ -254,8 +213,3 @@ cfg = Configurator(
 
     columns = {}
 )
-
-# Registering custom functions
-import cloudpickle
-cloudpickle.register_pickle_by_value(workflow)
-cloudpickle.register_pickle_by_value(mutag_calib)
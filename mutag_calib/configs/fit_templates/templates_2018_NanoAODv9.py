@@ -3,9 +3,11 @@ from workflows.mutag_oneMuAK8_processor import mutagAnalysisOneMuonInAK8Processo
 from pocket_coffea.lib.cut_functions import get_nObj_min
 from pocket_coffea.parameters.histograms import *
 from pocket_coffea.lib.categorization import CartesianSelection, MultiCut
-from config.fatjet_base.custom.cuts import get_nObj_minmsd, get_flavor, get_ptbin
+from config.fatjet_base.custom.cuts import get_nObj_minmsd, FLAVOR_CUTS, get_ptbin
+from config.binning import TAU21_BINS
 from config.fatjet_base.custom.functions import get_HLTsel, get_inclusive_wp
 from parameters import PtBinning, AK8TaggerWP, AK8Taggers
+from itertools import product
 
 PtBinning = PtBinning['UL']['2018']
 wps = AK8TaggerWP['UL']['2018']
@@ -21,13 +23,10 @@ cuts_names_pt = []
 for pt_low, pt_high in PtBinning.values():
     cuts_pt.append(get_ptbin(pt_low, pt_high))
     cuts_names_pt.append(f'Pt-{pt_low}to{pt_high}')
-cuts_tagger = []
-cuts_names_tagger = []
-for tagger in AK8Taggers:
-    for wp in ["L", "M", "H"]:
-        for region in ["pass", "fail"]:
-            cuts_tagger.append(get_inclusive_wp(tagger, wps[tagger][wp], region))
-            cuts_names_tagger.append(f"msd{int(msd)}{tagger}{region}{wp}wp")
+tagger_regions = list(product(AK8Taggers, ["L", "M", "H"], ["pass", "fail"]))
+cuts_tagger = [get_inclusive_wp(tagger, wps[tagger][wp], region) for tagger, wp, region in tagger_regions]
+msd_name = int(msd)
+cuts_names_tagger = [f"msd{msd_name}{tagger}{region}{wp}wp" for tagger, wp, region in tagger_regions]
 
 multicuts = [
     MultiCut(name="tagger",
@@ -42,9 +41,8 @@ samples = ["QCD_MuEnriched",
            "DATA"
            ]
 
-subsamples = {}
-for s in filter(lambda x: 'DATA' not in x, samples):
-    subsamples[s] = {f"{s}_{f}" : [get_flavor(f)] for f in ['l', 'c', 'b', 'cc', 'bb']}
+subsamples = {s : {f"{s}_{f}" : cut for f, cut in FLAVOR_CUTS.items()}
+              for s in samples if 'DATA' not in s}
 
 cfg =  {
     "dataset" : {
@@ -140,7 +138,7 @@ cfg =  {
         ),
         "FatJetGood_logsumcorrSVmass_tau21": HistConf(
             [ Axis(coll="FatJetGood", field="logsumcorrSVmass", label=r"log($\sum({m^{corr}_{SV}})$)", bins=42, start=-2.4, stop=6),
-              Axis(coll="FatJetGood", field="tau21", label=r"$\tau_{21}$", type="variable", bins=[0, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 1]) ]
+              Axis(coll="FatJetGood", field="tau21", label=r"$\tau_{21}$", type="variable", bins=TAU21_BINS) ]
         ),
     },
 
@@ -0,0 +1,19 @@
+import os
+import copy
+import functools
+
+from pocket_coffea.parameters import defaults
+
+@functools.lru_cache(maxsize=None)
+def _merge_parameters(files_and_mtimes):
+    return defaults.merge_parameters_from_files(defaults.get_default_parameters(),
+                                                *[file for file, _ in files_and_mtimes],
+                                                update=True)
+
+def load_parameters(*files):
+    '''Merge the default parameters with the parameters defined in `files`.
+    The files are parsed only once per process: the merged parameters are cached
+    and the cache is invalidated if the modification time of any of the files changes.
+    A copy of the cached parameters is returned, so that the configs cannot modify the cache.'''
+    key = tuple((file, os.path.getmtime(file)) for file in files)
+    return copy.deepcopy(_merge_parameters(key))
@@ -1,34 +1,26 @@
 from pocket_coffea.utils.configurator import Configurator
-from pocket_coffea.lib.cut_definition import Cut
-from pocket_coffea.lib.cut_functions import get_nObj_eq, get_nObj_min, get_HLTsel, get_nPVgood, goldenJson, eventFlags
-from pocket_coffea.parameters.cuts import passthrough
+from pocket_coffea.lib.cut_functions import get_nObj_min, get_HLTsel, get_nPVgood, goldenJson, eventFlags
 
 from pocket_coffea.lib.calibrators.common.common import JetsCalibrator, JetsSoftdropMassCalibrator
-from pocket_coffea.lib.weights.common.common import common_weights
 from pocket_coffea.parameters.histograms import *
-import mutag_calib
-from mutag_calib.configs.fatjet_base.custom.cuts import get_ptmsd, get_ptmsd_window, get_nObj_minmsd, get_flavor
-from mutag_calib.configs.fatjet_base.custom.functions import get_inclusive_wp
-from mutag_calib.configs.fatjet_base.custom.weights import SF_trigger_prescale
-import mutag_calib.workflows.pt_reweighting as workflow
+from mutag_calib.configs.fatjet_base.custom.cuts import get_ptmsd, get_ptmsd_window, get_nObj_minmsd, FLAVOR_CUTS
+from mutag_calib.configs.binning import TAU21_BINS, TAU21_BINS_COARSE, PT_BINS_REWEIGHTING, ETA_BINS_REWEIGHTING
+from mutag_calib.configs.fatjet_base.custom.weights import MUTAG_WEIGHTS
 from mutag_calib.workflows.pt_reweighting import ptReweightProcessor
-import numpy as np
 import os
 
 localdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Loading default parameters
 from pocket_coffea.parameters import defaults
-default_parameters = defaults.get_default_parameters()
+from mutag_calib.configs.parameters import load_parameters
 defaults.register_configuration_dir("config_dir", localdir+"/params")
 
-parameters = defaults.merge_parameters_from_files(default_parameters,
-                                                f"{localdir}/params/object_preselection.yaml",
-                                                f"{localdir}/params/jets_calibration.yaml",
-                                                f"{localdir}/params/triggers_run3.yaml",
-                                                f"{localdir}/params/triggers_prescales_run3.yaml",
-                                                f"{localdir}/params/plotting_style.yaml",
-                                                update=True)
+parameters = load_parameters(f"{localdir}/params/object_preselection.yaml",
+                             f"{localdir}/params/jets_calibration.yaml",
+                             f"{localdir}/params/triggers_run3.yaml",
+                             f"{localdir}/params/triggers_prescales_run3.yaml",
+                             f"{localdir}/params/plotting_style.yaml")
 
 samples = [
     "QCD_MuEnriched",
@@ -37,9 +29,8 @@ samples = [
     "SingleTop",
     "DATA_BTagMu"
 ]
-subsamples = {}
-for s in filter(lambda x: 'DATA_BTagMu' not in x, samples):
-    subsamples[s] = {f"{s}_{f}" : [get_flavor(f)] for f in ['l', 'c', 'b', 'cc', 'bb']}
+subsamples = {s : {f"{s}_{f}" : cut for f, cut in FLAVOR_CUTS.items()}
+              for s in samples if 'DATA_BTagMu' not in s}
 
 variables = {
     #**count_hist(name="nFatJetGood", coll="FatJetGood",bins=10, start=0, stop=10),
@@ -55,42 +46,41 @@ collections = ["FatJetGood"]
 for coll in collections:
     variables.update(**fatjet_hists(coll=coll))
     variables[f"{coll}_pt"] = HistConf([Axis(name=f"{coll}_pt", coll=coll, field="pt",
-                                                    label=r"FatJet $p_{T}$ [GeV]", bins=list(range(300, 1010, 10)))]
+                                                    label=r"FatJet $p_{T}$ [GeV]", bins=70, start=300, stop=1000)]
     )
     variables[f"{coll}_msoftdrop"] = HistConf([Axis(name=f"{coll}_msoftdrop", coll=coll, field="msoftdrop",
-                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=list(range(0, 410, 10)))]
+                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=40, start=0, stop=400)]
     )
     variables[f"{coll}_msoftdrop_raw"] = HistConf([Axis(name=f"{coll}_msoftdrop_raw", coll=coll, field="msoftdrop_raw",
-                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=list(range(0, 410, 10)))]
+                                                           label=r"FatJet $m_{SD}$ [GeV]", bins=40, start=0, stop=400)]
     )
     variables[f"{coll}_tau21"] = HistConf([Axis(name=f"{coll}_tau21", coll=coll, field="tau21",
-                                                           label=r"FatJet $\tau_{21}$", bins=[0, 0.20, 0.25, 0.30, 0.35, 
-                                                           0.40, 0.45, 0.50, 0.55, 0.60, 0.65, 0.70, 0.75, 0.80, 1])]
+                                                           label=r"FatJet $\tau_{21}$", bins=TAU21_BINS)]
     )
     variables[f"{coll}_pt_eta"] = HistConf(
         [ Axis(name=f"{coll}_pos", coll=coll, field="pos", type="int", label=r"FatJet position", bins=2, start=0, stop=2),
           Axis(name=f"{coll}_pt", coll=coll, field="pt", type="variable", label=r"FatJet $p_{T}$ [GeV]",
-               bins=[300., 320., 340., 360., 380., 400., 450., 500., 550., 600., 700., 800., 900., 2500.]),
+               bins=PT_BINS_REWEIGHTING),
           Axis(name=f"{coll}_eta", coll=coll, field="eta", type="variable", label=r"FatJet $\eta$",
-               bins=[-5, -2, -1.75, -1.5, -1.25, -1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2, 5]) ]
+               bins=ETA_BINS_REWEIGHTING) ]
     )
     variables[f"{coll}_pt_eta_tau21"] = HistConf(
         [ Axis(name=f"{coll}_pos", coll=coll, field="pos", type="int", label=r"FatJet position", bins=2, start=0, stop=2),
           Axis(name=f"{coll}_pt", coll=coll, field="pt", type="variable", label=r"FatJet $p_{T}$ [GeV]",
-               bins=[300., 320., 340., 360., 380., 400., 450., 500., 550., 600., 700., 800., 900., 2500.]),
+               bins=PT_BINS_REWEIGHTING),
           Axis(name=f"{coll}_eta", coll=coll, field="eta", type="variable", label=r"FatJet $\eta$",
-               bins=[-5, -2, -1.75, -1.5, -1.25, -1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2, 5]),
+               bins=ETA_BINS_REWEIGHTING),
           Axis(name=f"{coll}_tau21", coll=coll, field="tau21", type="variable", label=r"FatJet $\tau_{21}$",
-               bins=[0, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 1]) ]
+               bins=TAU21_BINS_COARSE) ]
     )
     variables[f"{coll}_pt_eta_tau21_bintau05"] = HistConf(
         [ Axis(name=f"{coll}_pos", coll=coll, field="pos", type="int", label=r"FatJet position", bins=2, start=0, stop=2),
           Axis(name=f"{coll}_pt", coll=coll, field="pt", type="variable", label=r"FatJet $p_{T}$ [GeV]",
-               bins=[300., 320., 340., 360., 380., 400., 450., 500., 550., 600., 700., 800., 900., 2500.]),
+               bins=PT_BINS_REWEIGHTING),
           Axis(name=f"{coll}_eta", coll=coll, field="eta", type="variable", label=r"FatJet $\eta$",
-               bins=[-5, -2, -1.75, -1.5, -1.25, -1, -0.75, -0.5, -0.25, 0, 0.25, 0.5, 0.75, 1, 1.25, 1.5, 1.75, 2, 5]),
+               bins=ETA_BINS_REWEIGHTING),
           Axis(name=f"{coll}_tau21", coll=coll, field="tau21", type="variable", label=r"FatJet $\tau_{21}$",
-               bins=[0, 0.20, 0.25, 0.30, 0.35, 0.40, 0.45, 0.50, 0.55, 0.60, 0.65, 0.70, 0.75, 0.80, 1]) ]
+               bins=TAU21_BINS) ]
     )
 
 cfg = Configurator(
@@ -135,7 +125,7 @@ cfg = Configurator(
         "pt300msd80to170" : [get_ptmsd_window(300., 80., 170.)],
     },
 
-    weights_classes = common_weights + [SF_trigger_prescale],
+    weights_classes = MUTAG_WEIGHTS,
     weights = {
         "common": {
             "inclusive": ["genWeight","lumi","XS","sf_trigger_prescale",
@@ -169,8 +159,3 @@ cfg = Configurator(
 
     columns = {}
 )
-
-# Registering custom functions
-import cloudpickle
-cloudpickle.register_pickle_by_value(workflow)
-cloudpickle.register_pickle_by_value(mutag_calib)
@@ -1,16 +1,73 @@
+import numpy as np
 import awkward as ak
+import numba as nb
 
-def run_deltar_matching(obj1, obj2, radius=0.4): # NxM , NxG arrays
+from .kernels import delta_r2, offsets
+
+@nb.njit(cache=True, parallel=True)
+def _closest_match(offsets1, eta1, phi1, radius2, offsets2, eta2, phi2, best):
+    '''For each obj2, store in `best` the index of the closest obj1 of the same event
+    if their squared distance is smaller than the squared radius of the obj1, -1 otherwise.'''
+    for e in nb.prange(offsets1.size - 1):
+        for j in range(offsets2[e], offsets2[e+1]):
+            i_min = -1
+            dr2_min = 0.0
+            for i in range(offsets1[e], offsets1[e+1]):
+                dr2 = delta_r2(eta1[i], phi1[i], eta2[j], phi2[j])
+                if i_min < 0 or dr2 < dr2_min:
+                    i_min = i
+                    dr2_min = dr2
+            best[j] = i_min if (i_min >= 0 and dr2_min < radius2[i_min]) else -1
+
+def _flat64(array):
+    '''Flat float64 buffer of a jagged array: the delta R is computed in double precision.
+    The float32 NanoAOD branches are copied by the conversion, the buffers already in double precision are not.
+    N.B.: the matching is not done in float32, since a single precision delta R can flip the matches
+    at the edge of the cone with respect to the double precision computation of coffea's metric_table.'''
+    return ak.to_numpy(ak.flatten(array)).astype(np.float64, copy=False)
+
+def _match(obj1, obj2, radius, radius2):
+    '''Returns the flat indices of the matched obj2, ordered by the obj1 they are matched to,
+    the number of obj2 matched to each obj1, and the number of obj1 and obj2 per event.'''
+    n1 = ak.to_numpy(ak.num(obj1))
+    n2 = ak.to_numpy(ak.num(obj2))
+    eta1 = _flat64(obj1.eta)
+    if radius2 is None:
+        if isinstance(radius, ak.Array):
+            radius2 = _flat64(radius)**2
+        else:
+            radius2 = np.full(eta1.size, radius**2, dtype=np.float64)
+    else:
+        radius2 = radius2.astype(np.float64, copy=False)
+
+    best = np.empty(n2.sum(), dtype=np.int64)
+    _closest_match(offsets(n1), eta1, _flat64(obj1.phi), radius2,
+                   offsets(n2), _flat64(obj2.eta), _flat64(obj2.phi),
+                   best)
+
+    # Order the matched obj2 by the obj1 they are matched to, keeping their original order within each obj1
+    matched = np.flatnonzero(best >= 0)
+    matched = matched[np.argsort(best[matched], kind="stable")]
+    nmatched = np.bincount(best[matched], minlength=eta1.size)
+    return matched, nmatched, n1, n2
+
+def run_deltar_matching(obj1, obj2, radius=0.4, radius2=None): # NxM , NxG arrays
     '''
-    Doing this you can keep the assignment on the obj2 collection unique, 
-    but you are not checking the uniqueness of the matching to the first collection. 
+    Each object of obj2 is assigned to the closest object of obj1 in the same event,
+    if their distance is smaller than `radius` (a number or a NxM array).
+    Alternatively, the squared radius of each obj1 can be passed as the flat array `radius2`.
+    Doing this you can keep the assignment on the obj2 collection unique,
+    but you are not checking the uniqueness of the matching to the first collection.
+    The matching is computed on the flat eta, phi arrays by a numba kernel, without building the NxMxG cartesian product.
+    Returns the NxMxG' array of the indices of the obj2 matched to each obj1, local to each event:
+    the obj2 records are not copied, use `run_deltar_matching_records` to get them.
     '''
-    _, obj2 = ak.unzip(ak.cartesian([obj1, obj2], nested=True)) # Obj2 is now NxMxG
-    obj2['dR'] = obj1.delta_r(obj2)  # Calculating delta R
-    t_index = ak.argmin(obj2.dR, axis=-2) # Finding the smallest dR (NxG array)
-    s_index = ak.local_index(obj1.eta, axis=-1) #  NxM array
-    _, t_index = ak.unzip(ak.cartesian([s_index, t_index], nested=True)) 
-    obj2 = obj2[s_index == t_index] # Pairwise comparison to keep smallest delta R
-    # Cutting on delta R
-    obj2 = obj2[obj2.dR < radius] #Additional cut on delta R, now a NxMxG' array 
-    return obj2
+    matched, nmatched, n1, n2 = _match(obj1, obj2, radius, radius2)
+    # Convert the flat indices to indices local to each event
+    idx = matched - np.repeat(offsets(n2)[:-1], n2)[matched]
+    return ak.unflatten(ak.unflatten(idx, nmatched), n1)
+
+def run_deltar_matching_records(obj1, obj2, radius=0.4, radius2=None):
+    '''Same as `run_deltar_matching`, but returns the NxMxG' array of the obj2 matched to each obj1.'''
+    matched, nmatched, n1, _ = _match(obj1, obj2, radius, radius2)
+    return ak.unflatten(ak.unflatten(ak.flatten(obj2)[matched], nmatched), n1)
@@ -10,22 +10,34 @@ import correctionlib
 from pocket_coffea.parameters.object_preselection import object_preselection
 from pocket_coffea.parameters.jec_config import JECjsonFiles
 
+from .muon_matching import n_mutagged_subjets
+
 def jet_mutag_selection(events, Jet, finalstate):
+    '''Selection of the mu-tagged jets of the fatjet collection `Jet`.
+    The mu-tagged subjets are counted with the unique matching of the MuonGood to the two subjets
+    used by the analysis (see `muon_matched_to_subjet`): the jets with less than two subjets have none.'''
 
     jets = events[Jet]
     cuts = object_preselection[finalstate][Jet]
 
-    if Jet == "FatJet":
-        njet_max = ak.max(ak.count(jets.pt, axis=1))
-        # Select jets with a minimum number of subjets
-        mask_nsubjet = (ak.count(jets.subjets.pt, axis=2) >= cuts["nsubjet"])
-        # Select jets with a minimum number of mu-tagged subjets
-        mask_nmusj = (nmusj >= cuts["nmusj"])
-        # Apply di-muon pT ratio cut on FatJets
-        mask_ptratio = (events.dimuon.pt / events.FatJet.pt < cuts["dimuon_pt_ratio"])
-        mask_ptratio = ak.where( ak.is_none(mask_ptratio), ak.zeros_like(events.FatJet.pt, dtype=bool), mask_ptratio )
-        for mask in [mask_nsubjet, mask_nmusj, mask_ptratio]:
-            mask_good_jets = mask_good_jets & ak.pad_none(mask, njet_max)
-        mask_good_jets = mask[~ak.is_none(mask, axis=1)]
+    nj = ak.num(jets)
+    # All the requirements share the jagged structure of the jets: they are combined
+    # in a single expression on the flat arrays, without padding, and the mask is unflattened once
+    # Select jets with a minimum number of subjets
+    nsubjet = ak.to_numpy(ak.flatten(ak.num(jets.subjets, axis=2)))
+    # Select jets with a minimum number of mu-tagged subjets, matched only for the jets with two subjets
+    has_two_subjets = nsubjet >= 2
+    nmusj = np.zeros(len(nsubjet), dtype=np.int64)
+    nmusj[has_two_subjets] = ak.to_numpy(ak.flatten(
+        n_mutagged_subjets(jets[ak.unflatten(has_two_subjets, nj)], events.MuonGood)
+    ))
+    # Apply di-muon pT ratio cut on FatJets: the jets of events without a dimuon fail the cut
+    dimuon_pt = np.repeat(ak.to_numpy(ak.fill_none(events.dimuon.pt, np.nan)), ak.to_numpy(nj))
+    mask_good_jets = ak.unflatten(
+        (nsubjet >= cuts["nsubjet"])
+        & (nmusj >= cuts["nmusj"])
+        & (dimuon_pt / ak.to_numpy(ak.flatten(jets.pt)) < cuts["dimuon_pt_ratio"]),
+        nj
+    )
 
     return jets[mask_good_jets], mask_good_jets
@@ -0,0 +1,22 @@
+import math
+
+import numpy as np
+import numba as nb
+
+# Helpers shared by the numba kernels running on the flat arrays of the jagged collections.
+# The delta R is computed in double precision and without fastmath, such that the
+# comparisons with the cone radius are exact and well defined for NaN inputs.
+
+@nb.njit(cache=True)
+def delta_r2(eta1, phi1, eta2, phi2):
+    deta = eta1 - eta2
+    dphi = phi1 - phi2
+    if dphi > math.pi:
+        dphi -= 2 * math.pi
+    elif dphi < -math.pi:
+        dphi += 2 * math.pi
+    return deta * deta + dphi * dphi
+
+def offsets(counts):
+    '''Offsets of the flat array of a jagged collection, given the number of elements per event.'''
+    return np.concatenate(([0], np.cumsum(counts)))
@@ -1,28 +1,38 @@
 import numpy as np
+import awkward as ak
 
 def lepton_selection_noniso(events, Lepton, params):
 
-    leptons = events[Lepton]
-    cuts = params.object_preselection[Lepton]
-    # Requirements on pT and eta
-    passes_eta = (np.abs(leptons.eta) < cuts["eta"])
-    passes_pt = (leptons.pt > cuts["pt"])
+    return select_leptons_noniso(events[Lepton], Lepton, params.object_preselection[Lepton])
 
-    if Lepton == "Electron":
-        # Requirements on SuperCluster eta, isolation and id
-        etaSC = np.abs(leptons.deltaEtaSC + leptons.eta)
-        passes_SC = np.invert((etaSC >= 1.4442) & (etaSC <= 1.5660))
-        passes_iso = leptons.pfRelIso03_all < cuts["iso"]
-        passes_id = (leptons[cuts['id']] == True)
+def select_leptons_noniso(leptons, Lepton, cuts):
+    '''Select the leptons of the collection `Lepton` passing the preselection `cuts`.'''
+    pt_cut, eta_cut, iso_cut, id_field = cuts["pt"], cuts["eta"], cuts["iso"], cuts["id"]
+    # The selection is computed in a single expression on the flat NumPy buffers
+    # and the resulting mask is unflattened only once
+    nlep = ak.num(leptons)
+    lep = ak.flatten(leptons)
+    eta = ak.to_numpy(lep.eta)
 
-        good_leptons = passes_eta & passes_pt & passes_SC & passes_iso & passes_id
+    if Lepton == "Electron":
+        # Requirements on pT and eta, SuperCluster eta, isolation and id
+        etaSC = np.abs(ak.to_numpy(lep.deltaEtaSC) + eta)
+        good_leptons = (
+            (np.abs(eta) < eta_cut)
+            & (ak.to_numpy(lep.pt) > pt_cut)
+            & ~((etaSC >= 1.4442) & (etaSC <= 1.5660))
+            & (ak.to_numpy(lep.pfRelIso03_all) < iso_cut)
+            & (ak.to_numpy(lep[id_field]) == True)
+        )
 
     elif Lepton == "Muon":
-        # Requirements on isolation and id
+        # Requirements on pT and eta, isolation and id
         # N.B.: INVERTED ISOLATION REQUIREMENT FOR MUON TAGGING !!!
-        passes_iso = leptons.pfRelIso04_all > cuts["iso"]
-        passes_id = (leptons[cuts['id']] == True)
-
-        good_leptons = passes_eta & passes_pt & passes_iso & passes_id
+        good_leptons = (
+            (np.abs(eta) < eta_cut)
+            & (ak.to_numpy(lep.pt) > pt_cut)
+            & (ak.to_numpy(lep.pfRelIso04_all) > iso_cut)
+            & (ak.to_numpy(lep[id_field]) == True)
+        )
 
-    return leptons[good_leptons]
\ No newline at end of file
+    return leptons[ak.unflatten(good_leptons, nlep)]
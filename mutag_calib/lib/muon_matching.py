@@ -1,11 +1,12 @@
+import numpy as np
 import awkward as ak
-from .deltar_matching import run_deltar_matching
+from .deltar_matching import run_deltar_matching_records
 
 def muons_matched_to_fatjet(events):
     '''This function returns the collection of muons matched to the fatjets.
     The output array has the same shape as the events.FatJetGood collection.
     '''
-    return run_deltar_matching(events.FatJetGood, events.MuonGood, radius=0.8)
+    return run_deltar_matching_records(events.FatJetGood, events.MuonGood, radius=0.8)
 
 def muon_matched_to_subjet(events, pos, unique=True):
     '''This function returns the collection of muons matched to the subjet in the position `pos` contained in the AK8 jet.
@@ -13,20 +14,34 @@ def muon_matched_to_subjet(events, pos, unique=True):
     If pos=1, the muons matched to the leading subjet are returned.
     The output array has the same shape as the events.FatJetGood collection.
     '''
+    muons_matched = _muons_matched_to_subjet(events.FatJetGood, events.MuonGood, pos, unique)
+
+    # Of all the muons contained in the dR cone, we only consider the leading muon to be matched to the subjet
+    # N.B.: the output array has 3 dimensions, with a single muon per subjet (None if no muon is matched)
+    return ak.pad_none(muons_matched[:,:,:1], 1, axis=2, clip=True)
+
+def n_mutagged_subjets(fatjets, muons, unique=True):
+    '''Number of subjets of each fatjet with at least one muon matched, with the same matching as `muon_matched_to_subjet`.
+    The fatjets are required to have two subjets.
+    The output array has the same shape as the fatjets collection.
+    '''
+    return sum(
+        ak.values_astype(ak.num(_muons_matched_to_subjet(fatjets, muons, pos, unique), axis=2) > 0, np.int64)
+        for pos in (0, 1)
+    )
+
+def _muons_matched_to_subjet(fatjets, muons, pos, unique=True):
     R = 0.4
-    sj = events.FatJetGood.subjets[:,:,pos]
+    sj = fatjets.subjets[:,:,pos]
+    # This collection of muons will contain all the muons contained within the dR cone
     if unique:
-        sj1 = events.FatJetGood.subjets[:,:,0]
-        sj2 = events.FatJetGood.subjets[:,:,1]
-        dr_sj1_sj2 = sj1.delta_r(sj2)
-        dr_non_overlapping_cone = 0.5 * dr_sj1_sj2
-        radius = ak.where(dr_non_overlapping_cone > R, R, dr_non_overlapping_cone)
+        # The radius of the non-overlapping cones is half the distance between the two subjets, at most R.
+        # Its square is computed once per fatjet on the flat subjet arrays
+        sj1 = ak.flatten(fatjets.subjets[:,:,0])
+        sj2 = ak.flatten(fatjets.subjets[:,:,1])
+        deta = ak.to_numpy(sj1.eta) - ak.to_numpy(sj2.eta)
+        dphi = (ak.to_numpy(sj1.phi) - ak.to_numpy(sj2.phi) + np.pi) % (2 * np.pi) - np.pi
+        radius2 = np.minimum(0.25 * (deta**2 + dphi**2), R**2)
+        return run_deltar_matching_records(sj, muons, radius2=radius2)
     else:
-        radius = R
-
-    # This collection of muons will contain all the muons contained within the dR cone
-    muons_matched = run_deltar_matching(sj, events.MuonGood, radius=radius)
-
-    # Of all the muons contained in the dR cone, we only consider the leading muon to be matched to the subjet
-    # N.B.: the slicing syntax `[:,:,None]` is needed in order for the output array to have a 3 dimensions
-    return ak.firsts(muons_matched, axis=2)[:,:,None]
+        return run_deltar_matching_records(sj, muons, radius=R)
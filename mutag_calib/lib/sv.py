@@ -1,10 +1,12 @@
 import sys
+import math
 
 import collections
 import numpy as np
 import awkward as ak
+import numba as nb
 
-from .deltar_matching import run_deltar_matching
+from .deltar_matching import run_deltar_matching_records
 
 def project(a, b):
     return a.dot(b)/b.dot(b) * b
@@ -13,7 +15,7 @@ def sv_matched_to_fatjet(events):
     '''This function returns the collection of SV matched to the fatjets.
     The output array has the same shape as the events.FatJetGood collection.
     '''
-    return run_deltar_matching(events.FatJetGood, events.SV, radius=0.8)
+    return run_deltar_matching_records(events.FatJetGood, events.SV, radius=0.8)
 
 # N.B.: In the following the logarithm of the mass-like variables is set to -5 as default value,
 # when the corresponding mass value is 0. This way, the log(mass) histograms will be filled with
@@ -28,11 +30,15 @@ def get_projmass(jet, sv, pos, log=True):
     else:
         raise Exception("Only the leading and subleading jets can be considered.")
     
-    nsv = ak.count(sv.pt, axis=1)
+    nsv = ak.num(sv, axis=1)
     projmass = project(sv.p4.sum(), jet).mass
 
     if log:
-        logprojmass = ak.where(nsv < 1, -5, np.log(projmass))
+        # The log is evaluated only for the events with at least one SV, -5 is assigned otherwise
+        has_sv = ak.to_numpy(nsv >= 1)
+        logprojmass = np.log(ak.to_numpy(ak.fill_none(projmass, 0)), out=np.full(len(projmass), -5.0), where=has_sv)
+        # Events without the requested jet are kept as None
+        logprojmass = ak.mask(logprojmass, ~ak.is_none(projmass))
         return projmass, logprojmass
     else:
         return projmass
@@ -58,23 +64,49 @@ def get_corrmass(sv):
 
 def get_sv1mass(sv, log=True):
 
-    sv1mass = ak.firsts(sv.mass, axis=-1)[:,0]
-    sv1mass = ak.where(ak.is_none(sv1mass), 0, sv1mass)
+    sv1mass = ak.to_numpy(ak.fill_none(ak.firsts(sv.mass, axis=-1)[:,0], 0))
 
     if log:
-        logsv1mass = np.where(sv1mass == 0, -5, np.log(sv1mass))
+        # The log is evaluated only for the non-null masses, -5 is assigned otherwise
+        logsv1mass = np.log(sv1mass, out=np.full(len(sv1mass), -5.0), where=sv1mass != 0)
         return sv1mass, logsv1mass
     else:
         return sv1mass
 
 
-#def get_sumcorrmass(sv, log=True):
-def get_sumcorrmass(sv, log=True):
-
-    sumcorrmass = sv.p4.sum().mass
+@nb.njit(cache=True, parallel=True)
+def _sum_p4_mass(offsets, pt, eta, phi, mass, out):
+    # Invariant mass of the sum of the 4-momenta of the SVs of each jet
+    for i in nb.prange(len(offsets) - 1):
+        px, py, pz, e = 0.0, 0.0, 0.0, 0.0
+        for j in range(offsets[i], offsets[i + 1]):
+            px_j = pt[j] * math.cos(phi[j])
+            py_j = pt[j] * math.sin(phi[j])
+            pz_j = pt[j] * math.sinh(eta[j])
+            px += px_j
+            py += py_j
+            pz += pz_j
+            e += math.sqrt(px_j * px_j + py_j * py_j + pz_j * pz_j + mass[j] * mass[j])
+        out[i] = math.sqrt(max(e * e - px * px - py * py - pz * pz, 0.0))
+
+def get_sumcorrmass(sv, log=True, nsv=None):
+    '''Mass of the sum of the SVs matched to each fatjet. The SV collection has shape NxMxG.
+    The number of SVs of each jet (NxM) can be passed as `nsv`, if already computed by the caller.
+    The sum over the SVs of each jet is computed with a numba kernel on the flat SV arrays.'''
+    if nsv is None:
+        nsv = ak.num(sv, axis=2)
+    njet = ak.num(nsv, axis=1)
+    nsv = ak.to_numpy(ak.flatten(nsv))
+    offsets = np.concatenate(([0], np.cumsum(nsv)))
+    sumcorrmass = np.empty(len(nsv), dtype=np.float64)
+    _sum_p4_mass(offsets,
+                 *[ak.to_numpy(ak.flatten(sv[field], axis=None)) for field in ["pt", "eta", "phi", "mass"]],
+                 sumcorrmass)
 
     if log:
-        logsumcorrmass = np.log(sumcorrmass)
-        return sumcorrmass, logsumcorrmass
+        # Jets without SVs have a null mass, i.e. log(mass) = -inf, as for the sum of the SV 4-momenta
+        with np.errstate(divide="ignore"):
+            logsumcorrmass = np.log(sumcorrmass)
+        return ak.unflatten(sumcorrmass, njet), ak.unflatten(logsumcorrmass, njet)
     else:
-        return sumcorrmass
+        return ak.unflatten(sumcorrmass, njet)
@@ -14,9 +14,15 @@ import yaml
 import argparse
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 def load_yaml_config(config_path):
     """Load the YAML configuration file with prescales."""
     with open(config_path, 'r') as f:
@@ -30,74 +36,93 @@ def resolve_config_path(path_string, config_dir):
     return path_string
 
 def load_prescale_json(json_path):
-    """Load and parse a prescale JSON file."""
+    """Load and parse a prescale JSON file. The faster orjson parser is used if available."""
+    if orjson is not None:
+        with open(json_path, 'rb') as f:
+            return orjson.loads(f.read())
     with open(json_path, 'r') as f:
         data = json.load(f)
     return data
 
 def parse_prescale_data(data):
-    """Parse prescale data to extract run numbers, lumi sections, and weights."""
-    prescale_info = []
-    
+    """Parse prescale data to extract run numbers, lumi sections, and weights.
+    The entries are counted first, then the columns are filled in preallocated NumPy arrays
+    and returned as a DataFrame, with the HLT paths encoded as categorical codes."""
     # Navigate the JSON structure
-    corrections = data.get("corrections", [])
-    for correction in corrections:
-        if correction.get("name") == "prescaleWeight":
-            content = correction.get("data", {}).get("content", [])
-            
-            for run_entry in content:
-                run_number = run_entry["key"]
-                path_content = run_entry["value"]["content"]
-                
-                for path_entry in path_content:
-                    hlt_path = path_entry["key"]
-                    weight_data = path_entry["value"]
-                    
-                    # Handle different weight data structures
-                    if isinstance(weight_data, (int, float)):
-                        # Simple constant weight
-                        prescale_info.append({
-                            'run': run_number,
-                            'hlt_path': hlt_path,
-                            'lumi_start': 1,
-                            'lumi_end': float('inf'),
-                            'weight': float(weight_data)
-                        })
-                    elif isinstance(weight_data, dict) and weight_data.get("nodetype") == "binning":
-                        # Binned weights by lumi section
-                        edges = weight_data["edges"]
-                        content = weight_data["content"]
-                        
-                        for i, weight in enumerate(content):
-                            lumi_start = edges[i]
-                            lumi_end = edges[i+1] if i+1 < len(edges) else float('inf')
-                            
-                            prescale_info.append({
-                                'run': run_number,
-                                'hlt_path': hlt_path,
-                                'lumi_start': lumi_start,
-                                'lumi_end': lumi_end,
-                                'weight': float(weight)
-                            })
-    
-    return prescale_info
+    entries = [(run_entry["key"], path_entry["key"], path_entry["value"])
+               for correction in data.get("corrections", []) if correction.get("name") == "prescaleWeight"
+               for run_entry in correction.get("data", {}).get("content", [])
+               for path_entry in run_entry["value"]["content"]]
+
+    def nbins(weight_data):
+        # Handle different weight data structures
+        if isinstance(weight_data, (int, float)):
+            # Simple constant weight
+            return 1
+        elif isinstance(weight_data, dict) and weight_data.get("nodetype") == "binning":
+            # Binned weights by lumi section
+            return len(weight_data["content"])
+        return 0
+
+    nentries = np.array([nbins(weight_data) for _, _, weight_data in entries], dtype=np.int64)
+    n = nentries.sum()
+    run = np.empty(n, dtype=np.int64)
+    hlt_path_id = np.empty(n, dtype=np.int32)
+    lumi_start = np.empty(n, dtype=np.float64)
+    lumi_end = np.full(n, np.inf)
+    weight = np.empty(n, dtype=np.float64)
+    hlt_paths = {}
+
+    i = 0
+    for (run_number, hlt_path, weight_data), k in zip(entries, nentries):
+        if k == 0:
+            continue
+        run[i:i+k] = run_number
+        hlt_path_id[i:i+k] = hlt_paths.setdefault(hlt_path, len(hlt_paths))
+        if isinstance(weight_data, dict):
+            edges = np.asarray(weight_data["edges"], dtype=np.float64)
+            lumi_start[i:i+k] = edges[:k]
+            # The last bin is open-ended if no upper edge is given
+            nclosed = min(k, len(edges) - 1)
+            lumi_end[i:i+nclosed] = edges[1:nclosed+1]
+            weight[i:i+k] = weight_data["content"]
+        else:
+            lumi_start[i] = 1
+            weight[i] = float(weight_data)
+        i += k
+
+    return pd.DataFrame({
+        'run': run,
+        'hlt_path': pd.Categorical.from_codes(hlt_path_id, categories=list(hlt_paths)),
+        'lumi_start': lumi_start,
+        'lumi_end': lumi_end,
+        'weight': weight
+    }, copy=False)
+
+def parse_prescale_file(json_file):
+    """Load and parse a prescale JSON file. Defined at module level to be run in a process pool."""
+    return parse_prescale_data(load_prescale_json(json_file))
 
 def calculate_averages(prescale_data):
     """Calculate various averages of prescale factors."""
-    df = pd.DataFrame(prescale_data)
+    df = pd.concat(prescale_data, ignore_index=True)
+    # Group on integer keys: the HLT paths are categorical and the runs are stored as int32
+    df['hlt_path'] = df['hlt_path'].astype('category')
+    df['run'] = df['run'].astype('int32')
     
     results = {}
     
+    # The averages are not rounded here: they are rounded when printed or saved
     # Overall average by HLT path
-    path_averages = df.groupby('hlt_path')['weight'].agg(['mean', 'std', 'count']).round(4)
+    path_averages = df.groupby('hlt_path', observed=True, sort=False)['weight'].agg(['mean', 'std', 'count'])
     results['by_hlt_path'] = path_averages
     
     # Average by run number
-    run_averages = df.groupby('run')['weight'].agg(['mean', 'std', 'count']).round(4)
+    run_averages = df.groupby('run', sort=False)['weight'].agg(['mean', 'std', 'count'])
     results['by_run'] = run_averages
     
     # Average by run and HLT path
-    run_path_averages = df.groupby(['run', 'hlt_path'])['weight'].agg(['mean', 'std', 'count']).round(4)
+    run_path_averages = df.groupby([df['run'], df['hlt_path']], observed=True, sort=False)['weight'].agg(['mean', 'std', 'count'])
     results['by_run_and_path'] = run_path_averages
     
     # Overall statistics
@@ -136,7 +161,8 @@ def print_summary(results):
     # By HLT path
     print(f"\nAVERAGE PRESCALES BY HLT PATH:")
     print("-" * 60)
-    by_path = results['by_hlt_path']
+    # The tables are grouped without sorting: sort and round them as in the saved CSV files
+    by_path = results['by_hlt_path'].sort_index().round(4)
     for path, stats in by_path.iterrows():
         print(f"  {path}:")
         print(f"    Mean: {stats['mean']:.4f} ± {stats['std']:.4f} ({stats['count']} entries)")
@@ -144,18 +170,25 @@ def print_summary(results):
     # Top 10 runs with highest average prescales
     print(f"\nTOP 10 RUNS WITH HIGHEST AVERAGE PRESCALES:")
     print("-" * 60)
-    top_runs = results['by_run'].nlargest(10, 'mean')
+    by_run = results['by_run'].sort_index().round(4)
+    top_runs = by_run.nlargest(10, 'mean')
     for run, stats in top_runs.iterrows():
         print(f"  Run {run}: {stats['mean']:.4f} ± {stats['std']:.4f} ({stats['count']} entries)")
     
     # Runs with zero prescales
-    zero_runs = results['by_run'][results['by_run']['mean'] == 0]
+    zero_runs = by_run[by_run['mean'] == 0]
     if len(zero_runs) > 0:
         print(f"\nRUNS WITH ZERO AVERAGE PRESCALES:")
         print("-" * 60)
         for run, stats in zero_runs.iterrows():
             print(f"  Run {run}: {stats['count']} entries")
 
+def to_native(obj):
+    """Convert numpy scalars to native Python types for JSON serialization."""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 def save_detailed_results(results, df, output_dir):
     """Save detailed results to CSV files."""
     output_dir = Path(output_dir)
@@ -165,17 +198,14 @@ def save_detailed_results(results, df, output_dir):
     df.to_csv(output_dir / "prescale_raw_data.csv", index=False)
     
     # Save averages
-    results['by_hlt_path'].to_csv(output_dir / "averages_by_hlt_path.csv")
-    results['by_run'].to_csv(output_dir / "averages_by_run.csv") 
-    results['by_run_and_path'].to_csv(output_dir / "averages_by_run_and_path.csv")
+    for key, filename in [('by_hlt_path', "averages_by_hlt_path.csv"),
+                          ('by_run', "averages_by_run.csv"),
+                          ('by_run_and_path', "averages_by_run_and_path.csv")]:
+        results[key].sort_index().round(4).to_csv(output_dir / filename)
     
     # Save overall statistics
     with open(output_dir / "overall_statistics.json", 'w') as f:
-        # Convert numpy types to native Python types for JSON serialization
-        overall_json = {k: float(v) if isinstance(v, np.floating) else 
-                       int(v) if isinstance(v, np.integer) else v 
-                       for k, v in results['overall'].items()}
-        json.dump(overall_json, f, indent=2)
+        json.dump(results['overall'], f, indent=2, default=to_native)
     
     print(f"\nDetailed results saved to: {output_dir}")
 
@@ -189,6 +219,8 @@ def main():
                        help="Specific year to analyze (e.g., '2022_preEE'). If not specified, analyze all years.")
     parser.add_argument("--trigger-group", default=None, 
                        help="Specific trigger group to analyze (e.g., 'BTagMu'). If not specified, analyze all groups.")
+    parser.add_argument("--workers", "-j", type=int, default=None,
+                       help="Number of processes used to parse the JSON files. By default, the number of CPUs is used.")
     
     args = parser.parse_args()
     
@@ -206,6 +238,7 @@ def main():
     
     all_prescale_data = []
     processed_files = set()
+    jobs = []
     
     print(f"Processing prescale files...")
     
@@ -235,29 +268,32 @@ def main():
                 processed_files.add(str(json_file))
                 
                 print(f"    Processing: {trigger_name} -> {json_file.name}")
+                jobs.append((json_file, year, trigger_group, trigger_name))
+    
+    # The JSON files are parsed in parallel, the results are collected in the order of the jobs
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(parse_prescale_file, json_file) for json_file, *_ in jobs]
+        for (json_file, year, trigger_group, trigger_name), future in zip(jobs, futures):
+            try:
+                prescale_info = future.result()
+                
+                # Add metadata
+                prescale_info = prescale_info.assign(year=year,
+                                                     trigger_group=trigger_group,
+                                                     trigger_name=trigger_name,
+                                                     json_file=json_file.name)
+                
+                all_prescale_data.append(prescale_info)
+                print(f"    {trigger_name}: found {len(prescale_info)} prescale entries")
                 
-                try:
-                    prescale_json = load_prescale_json(json_file)
-                    prescale_info = parse_prescale_data(prescale_json)
-                    
-                    # Add metadata
-                    for entry in prescale_info:
-                        entry['year'] = year
-                        entry['trigger_group'] = trigger_group
-                        entry['trigger_name'] = trigger_name
-                        entry['json_file'] = json_file.name
-                    
-                    all_prescale_data.extend(prescale_info)
-                    print(f"      Found {len(prescale_info)} prescale entries")
-                    
-                except Exception as e:
-                    print(f"      Error processing {json_file}: {e}")
+            except Exception as e:
+                print(f"    Error processing {json_file}: {e}")
     
     if not all_prescale_data:
         print("No prescale data found!")
         return
     
-    print(f"\nTotal prescale entries collected: {len(all_prescale_data)}")
+    print(f"\nTotal prescale entries collected: {sum(len(df) for df in all_prescale_data)}")
     
     # Calculate averages
     print("Calculating averages...")
@@ -1,5 +1,7 @@
 import os
 import argparse
+import operator
+from functools import reduce
 from collections import defaultdict
 import numpy as np
 import hist
@@ -23,10 +25,8 @@ def stack_sum(stack):
     if len(stack) == 1:
         return stack[0]
     else:
-        htot = stack[0]
-        for h in stack[1:]:
-            htot = htot + h
-        return htot
+        # The histograms are added in place to a copy of the first one, without intermediate histograms
+        return reduce(operator.iadd, stack[1:], stack[0].copy())
 
 def get_axis_items(h, axis_name):
     axis = h.axes[axis_name]
@@ -47,14 +47,23 @@ def get_data_mc_ratio(h_data, h_qcd, h_diff):
     ratio = num / den
     sumw2_num = h_data.variances() + h_diff.variances()
     sumw2_den = h_qcd.variances()
+    # The terms shared by the two uncertainties are computed once: den**2 and (num**2/den**4)*sumw2_den
+    den2 = np.square(den)
+    unc_den = np.square(ratio)
+    unc_den *= sumw2_den
+    unc_den /= den2
     # Statistical uncertainty on the reweighting SF taking into account
     # the uncertainty on data, QCD, top and WJets
-    unc = np.sqrt( sumw2_num/den**2 + (num**2/den**4)*sumw2_den )
+    unc = np.divide(sumw2_num, den2, out=sumw2_num)
+    unc += unc_den
+    np.sqrt(unc, out=unc)
     # Statistical uncertainty on the reweighting SF taking into account
     # the uncertainty on data and QCD only
-    unc_no_diff = np.sqrt( data/den**2 + (num**2/den**4)*sumw2_den )
-    unc[np.isnan(unc)] = 0
-    unc_no_diff[np.isnan(unc_no_diff)] = 0
+    unc_no_diff = data / den2
+    unc_no_diff += unc_den
+    np.sqrt(unc_no_diff, out=unc_no_diff)
+    np.nan_to_num(unc, copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    np.nan_to_num(unc_no_diff, copy=False, nan=0.0, posinf=np.inf, neginf=-np.inf)
 
     return ratio, unc, unc_no_diff
 
@@ -80,28 +89,38 @@ pt_eta_tau21_3d_maps = [
 def pt_reweighting(accumulator, histname, output, test=False, overwrite=False):
     years = accumulator["datasets_metadata"]["by_datataking_period"].keys()
     h = accumulator['variables'][histname]
-    samples = h.keys()
-    samples_data = list(filter(lambda d: 'DATA' in d, samples))
-    samples_mc = list(filter(lambda d: 'DATA' not in d, samples))
-    samples_qcd = list(filter(lambda d: 'QCD_MuEnriched' in d, samples_mc))
-    samples_vjets_top = list(filter(lambda d: (('VJets' in d) | ('SingleTop' in d) | ('TTto4Q' in d)), samples_mc))
+    # Classify the samples in QCD, VJets+top and Data in a single pass
+    samples = defaultdict(list)
+    for s in h.keys():
+        if 'DATA' in s:
+            samples["data"].append(s)
+        elif 'QCD_MuEnriched' in s:
+            samples["qcd"].append(s)
+        elif ('VJets' in s) or ('SingleTop' in s) or ('TTto4Q' in s):
+            samples["vjets_top"].append(s)
 
     # Compute a 3D correction for each year and save it in a separate json file
     for year in years:
-        # Build QCD, VJets+top and Data histograms by summing over all datasets and filtering by year
-        h_qcd = sum([h[s][d] for s, datasets_dict in h.items() for d in datasets_dict if ((s in samples_qcd) & (year in d))])
-        h_vjets_top = sum([h[s][d] for s, datasets_dict in h.items() for d in datasets_dict if ((s in samples_vjets_top) & (year in d))])
-        h_data = sum([h[s][d] for s, datasets_dict in h.items() for d in datasets_dict if ((s in samples_data) & (year in d))])
+        # Build QCD, VJets+top and Data histograms by summing over all datasets and filtering by year.
+        # Each group is summed in place into a copy of its first histogram
+        hists = {group: [hd for s in samples[group] for d, hd in h[s].items() if year in d]
+                 for group in ["qcd", "vjets_top", "data"]}
+        h_qcd, h_vjets_top, h_data = [reduce(operator.iadd, hists[group][1:], hists[group][0].copy())
+                                      for group in ["qcd", "vjets_top", "data"]]
 
         axes = dense_axes(h_qcd)
         categories = get_axis_items(h_qcd, 'cat')
-        variations = get_axis_items(h_qcd, 'variation')
-
-        ratio_dict = defaultdict(float)
+        shape_variations = get_axis_items(h_qcd, 'variation')
+        variations = ["nominal", "statUp", "statDown"]
+        axis_category = hist.axis.StrCategory(categories, name="cat")
+        axis_shape_variation = hist.axis.StrCategory(shape_variations, name="shape_variation")
+        axis_variation = hist.axis.StrCategory(variations, name="variation")
 
-        for cat in categories:
-            ratio_dict[cat] = {}
-            for var_shape in variations:
+        # The nominal, statUp, statDown maps of each category and shape variation
+        # are written directly in the preallocated stacked array
+        stack_map = np.empty((len(categories), len(shape_variations), len(variations), *[len(ax) for ax in axes]))
+        for i, cat in enumerate(categories):
+            for j, var_shape in enumerate(shape_variations):
                 slicing_mc = {'cat': cat, 'variation': var_shape}
 
                 if 'era' in h_data.axes.name:
@@ -113,23 +132,13 @@ def pt_reweighting(accumulator, histname, output, test=False, overwrite=False):
                     h_qcd[slicing_mc],
                     h_vjets_top[slicing_mc]
                 )
-                mod_ratio  = np.nan_to_num(ratio, nan=1.0)
-                mod_unc = np.nan_to_num(unc, nan=0.0)
-                mod_unc_no_diff = np.nan_to_num(unc_no_diff, nan=0.0)
-
-                ratio_dict[cat][var_shape] = {}
-                ratio_dict[cat][var_shape].update({ "nominal" : mod_ratio })
-                ratio_dict[cat][var_shape].update({ "statUp" : mod_ratio + mod_unc })
-                ratio_dict[cat][var_shape].update({ "statDown" : mod_ratio - mod_unc })
-
-        categories = list(ratio_dict.keys())
-        shape_variations = list(ratio_dict[categories[0]].keys())
-        variations = list(ratio_dict[categories[0]][shape_variations[0]].keys())
-        axis_category = hist.axis.StrCategory(categories, name="cat")
-        axis_shape_variation = hist.axis.StrCategory(shape_variations, name="shape_variation")
-        axis_variation = hist.axis.StrCategory(variations, name="variation")
-        # Stack nominal, statUp, statDown maps for each category
-        stack_map = np.stack([[list(ratio_dict[cat][var_shape].values()) for var_shape in shape_variations] for cat in categories])
+                mod_ratio = np.nan_to_num(ratio, copy=False, nan=1.0)
+                mod_unc = np.nan_to_num(unc, copy=False, nan=0.0)
+
+                stack_map[i, j, 0] = mod_ratio
+                np.add(mod_ratio, mod_unc, out=stack_map[i, j, 1])
+                np.subtract(mod_ratio, mod_unc, out=stack_map[i, j, 2])
+
         sfhist = hist.Hist(axis_category, axis_shape_variation, axis_variation, *axes, data=stack_map)
         sfhist.label = "out"
         sfhist.name = f"{histname}_corr_{year}"
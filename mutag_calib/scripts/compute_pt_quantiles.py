@@ -1,11 +1,74 @@
+import operator
+from functools import reduce
 import yaml
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 import numpy as np
 from coffea.util import load
 import awkward as ak
+import matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import mplhep as hep
 hep.style.use("CMS")
 
+def _cdf(values):
+    """Return the normalized CDF of a pT distribution."""
+    # Calculate cumulative distribution
+    cumsum = np.cumsum(values, dtype=np.float64)
+    total = cumsum[-1]
+
+    if total == 0:
+        raise ValueError("Empty pT histogram")
+
+    # Normalize to get CDF, in place in the cumulative sum buffer
+    return np.divide(cumsum, total, out=cumsum)
+
+def _interp_cdf(q, cdf, centers):
+    """
+    Invert the CDF by linear interpolation between the bin centers, for all the quantiles at once.
+    The CDF has flat steps in correspondence of empty bins: each quantile is interpolated
+    below the first bin where the CDF reaches it, and the bins with a flat CDF are skipped.
+    """
+    idx = np.searchsorted(cdf, q, side='left')
+    lb = np.clip(idx - 1, 0, len(cdf) - 1)
+    ub = np.clip(idx, 0, len(cdf) - 1)
+    dcdf = cdf[ub] - cdf[lb]
+    # The quantiles below the first bin are assigned to its center
+    frac = np.divide(q - cdf[lb], dcdf, out=np.zeros_like(q), where=dcdf > 0)
+    return centers[lb] + frac * (centers[ub] - centers[lb])
+
+def pt_quantiles(values, centers, quantiles=[0.25, 0.5, 0.75]):
+    """
+    Calculate quantiles of a pT distribution from the bin values and centers of a 1D histogram.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Bin values (counts/weights)
+    centers : np.ndarray
+        Bin centers of the pT axis, used for the interpolation.
+        They can be computed once and reused for all the histograms with the same pT axis.
+    quantiles : list of float
+        Quantile values to calculate (between 0 and 1)
+
+    Returns
+    -------
+    dict
+        Dictionary mapping quantile values to pT values, as Python floats
+    """
+    cdf = _cdf(values)
+
+    # Interpolate to find the pT values of all the quantiles at once
+    q = np.asarray(quantiles, dtype=float)
+    if np.any((q < 0) | (q > 1)):
+        raise ValueError(f"Quantiles {quantiles} must be between 0 and 1")
+    pt_values = _interp_cdf(q, cdf, centers)
+
+    return dict(zip(q.tolist(), pt_values.tolist()))
+
 def get_pt_quantiles(h, category='inclusive', quantiles=[0.25, 0.5, 0.75]):
     """
     Calculate quantiles of the pT distribution from a hist.Hist histogram.
@@ -22,7 +85,7 @@ def get_pt_quantiles(h, category='inclusive', quantiles=[0.25, 0.5, 0.75]):
     Returns
     -------
     dict
-        Dictionary mapping quantile values to pT values
+        Dictionary mapping quantile values to pT values, as Python floats
         
     Examples
     --------
@@ -31,37 +94,9 @@ def get_pt_quantiles(h, category='inclusive', quantiles=[0.25, 0.5, 0.75]):
     """
     # Select the category
     h_cat = h[{'cat': category}]
-    
-    # Get bin values (counts/weights) and edges
-    values = h_cat.values()
-    edges = h_cat.axes[0].edges
-    
-    # Calculate bin centers for interpolation
-    centers = (edges[:-1] + edges[1:]) / 2
-    
-    # Calculate cumulative distribution
-    cumsum = np.cumsum(values)
-    total = cumsum[-1]
-    
-    if total == 0:
-        raise ValueError(f"Empty histogram for category '{category}'")
-    
-    # Normalize to get CDF
-    cdf = cumsum / total
-    
-    # Interpolate to find quantile values
-    results = {}
-    for q in quantiles:
-        if q < 0 or q > 1:
-            raise ValueError(f"Quantile {q} must be between 0 and 1")
-        
-        # Find the pT value corresponding to this quantile
-        pt_value = np.interp(q, cdf, centers)
-        results[q] = pt_value
-    
-    return results
+    return pt_quantiles(h_cat.values(), h_cat.axes[0].centers, quantiles)
 
-def print_quantiles(h, category='inclusive', quantiles=[0.25, 0.5, 0.75, 0.9, 0.95, 0.99]):
+def print_quantiles(h, category='inclusive', quantiles=[0.25, 0.5, 0.75, 0.9, 0.95, 0.99], q_vals=None):
     """
     Print quantiles in a nicely formatted way.
     
@@ -73,8 +108,11 @@ def print_quantiles(h, category='inclusive', quantiles=[0.25, 0.5, 0.75, 0.9, 0.
         Category to select from the 'cat' axis
     quantiles : list of float
         Quantile values to calculate
+    q_vals : dict, optional
+        Quantiles already computed with `get_pt_quantiles`, printed without recomputing them
     """
-    q_vals = get_pt_quantiles(h, category, quantiles)
+    if q_vals is None:
+        q_vals = get_pt_quantiles(h, category, quantiles)
     
     print(f"pT quantiles for category '{category}':")
     print("-" * 40)
@@ -103,31 +141,43 @@ dataset_dict = {
     "2023_postBPix" : ["DATA_BTagMu_2023_postBPix_EraD"]
 }
 
+# Sum the datasets of each year in place into a copy of the first histogram
 histos = {}
 for year, datasets_byyear in dataset_dict.items():
-    h_data_byyear = sum(h_data[dataset] for dataset in datasets_byyear)
-    histos[year] = h_data_byyear
+    first, *others = datasets_byyear
+    histos[year] = reduce(operator.iadd, (h_data[dataset] for dataset in others), h_data[first].copy())
 
-quantiles = {}
+# Project the category once per year: the same bin values are used for the quantiles and the plot
 cat = "inclusive"
+values_by_year = {}
 for year, histo in histos.items():
-    quantiles[year] = get_pt_quantiles(histo, category=cat, quantiles=[0.34, 0.67, 1.0])
+    h_cat = histo[{"cat" : cat}]
+    values_by_year[year] = h_cat.values()
+# All the years share the same pT axis: its bin centers are computed only once
+pt_axis = h_cat.axes[0]
+pt_centers = pt_axis.centers
+
+quantiles = {}
+for year, values in values_by_year.items():
+    quantiles[year] = pt_quantiles(values, pt_centers, quantiles=[0.34, 0.67, 1.0])
 
 # Save quantiles to a YAML file
 filename = "pt_quantiles_run3.yaml"
 with open(filename, "w") as f:
-    yaml.dump(quantiles, f)
+    yaml.dump(quantiles, f, Dumper=SafeDumper, sort_keys=False)
 
-# Print quantiles
+# Print quantiles, reusing the values computed above
 for year, histo in histos.items():
     print(f"\nQuantiles for year {year}:")
-    print_quantiles(histo, category=cat, quantiles=[0.34, 0.67, 1.0])
+    print_quantiles(histo, category=cat, q_vals=quantiles[year])
 
 # Plotting the pT distributions with quantile lines
 fig, ax = plt.subplots(1, 1, figsize=[10,10])
 chosen_quantiles = [350, 425]
-for year, histo in histos.items():
-    histo[{"cat" : "inclusive"}].plot1d(ax=ax, label=f"Data ({year})")
+# The distributions of all the years are drawn in a single call
+hep.histplot(list(values_by_year.values()), pt_axis.edges, ax=ax,
+             label=[f"Data ({year})" for year in values_by_year])
+ax.set_xlabel(pt_axis.label)
 for q, linestyle, q_perc in zip(chosen_quantiles, ["dashed", "dotted"], [34, 67]):
     ax.vlines(q, 0, 175000., color="gray", linestyle=linestyle, label=f"{q_perc}% quantile ({q} GeV)")
 ax.legend()
@@ -139,4 +189,5 @@ hep.cms.text(
 )
 filename = "quantiles.png"
 print(f"Saving quantile plot to {filename}")
-plt.savefig(filename, dpi=300)
+plt.savefig(filename, dpi=150, bbox_inches="tight")
+plt.close(fig)
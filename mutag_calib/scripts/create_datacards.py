@@ -11,8 +11,13 @@ defined in the fit templates configuration.
 import os
 import argparse
 import yaml
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import uproot
 from coffea.util import load
 from hist import Hist
@@ -73,34 +78,31 @@ def define_processes(samples, years):
     return mc_processes, data_processes
 
 
+# Flavour process of the MC samples, from the suffix of the sample name after the last underscore
+FLAVOR_SUFFIXES = {"_l": "light", "_c": "c", "_cc": "c", "_b": "b", "_bb": "b"}
+
 def categorize_samples(cutflow):
     """Categorize samples based on their names."""
-    light_samples = set()
-    c_samples = set()
-    b_samples = set()
-    data_samples = set()
+    buckets = {"light": set(), "c": set(), "b": set(), "data_obs": set()}
 
     baseline_category = "inclusive"
 
-    for dataset, samples_dict in cutflow[baseline_category].items():
-        for sample_name in samples_dict.keys():
-            if sample_name.startswith("QCD_Madgraph_"):  # we don't want QCD Madgraph samples in the datacards, we use it for systematics
-                continue
-            elif sample_name.startswith("DATA_"):
-                data_samples.add(sample_name)
-            elif sample_name.endswith("_l"):
-                light_samples.add(sample_name)
-            elif sample_name.endswith(("_c", "_cc")):
-                c_samples.add(sample_name)
-            elif sample_name.endswith(("_b", "_bb")):
-                b_samples.add(sample_name)
-    
-    return {
-        "light": sorted(list(light_samples)),
-        "c": sorted(list(c_samples)),
-        "b": sorted(list(b_samples)),
-        "data_obs": sorted(list(data_samples))
-    }
+    # The same sample names appear in all the datasets: each name is classified only once
+    sample_names = set()
+    for samples_dict in cutflow[baseline_category].values():
+        sample_names.update(samples_dict.keys())
+
+    for sample_name in sample_names:
+        if sample_name.startswith("QCD_Madgraph_"):  # we don't want QCD Madgraph samples in the datacards, we use it for systematics
+            continue
+        elif sample_name.startswith("DATA_"):
+            buckets["data_obs"].add(sample_name)
+            continue
+        process = FLAVOR_SUFFIXES.get(sample_name[sample_name.rfind("_"):])
+        if process is not None:
+            buckets[process].add(sample_name)
+
+    return {process: sorted(names) for process, names in buckets.items()}
 
 
 def define_systematics(years, mc_process_names):
@@ -172,37 +174,46 @@ def define_systematics(years, mc_process_names):
     
     return systematics
 
-def get_passfail_ratio(datacards):
+def get_passfail_ratio(datacards, parent_categories=None):
     """Calculate the pass/fail ratio for each category and tau21 cut value.
     
     Args:
         datacards: Nested dictionary of format datacards[category][tau21] = datacard
+        parent_categories: Parent categories (without pass/fail) of the datacards.
+            If None, they are extracted from the datacard categories.
     
     Returns:
-        Dictionary of pass/fail ratios organized by parent category and tau21 cut
+        Dictionary of pass/fail ratios of each shape, keyed by the (parent category, tau21 cut) tuple
     """
-    sumw_percat = defaultdict(dict)
+    # The sums of weights of the shapes are stored in a dense array indexed by (parent category, tau21 cut, region, shape)
+    if parent_categories is None:
+        parent_categories = sorted({cat.rpartition("-")[0] for cat in datacards})
+    parent_index = {parent_cat: i for i, parent_cat in enumerate(parent_categories)}
+    tau21_index = {tau21: j for j, tau21 in enumerate(next(iter(datacards.values())))}
+    region_index = {"pass": 0, "fail": 1}
+    shape_index = None
+    sumw = None
     # First level: categories
-    for cat in datacards:
+    for cat, datacards_cat in datacards.items():
+        parent_cat, _, region = cat.rpartition("-")
         # Second level: tau21 cuts
-        for tau21, datacard in datacards[cat].items():
+        for tau21, datacard in datacards_cat.items():
             shape_histograms = datacard.create_shape_histogram_dict(is_data=False)
-            sumw_percat[cat][tau21] = {
-                process_name.split("_nominal")[0]: hist.values().sum() 
-                for process_name, hist in shape_histograms.items()
-            }
+            names = [process_name.split("_nominal")[0] for process_name in shape_histograms]
+            if sumw is None:
+                shape_index = {name: k for k, name in enumerate(names)}
+                sumw = np.zeros((len(parent_index), len(tau21_index), len(region_index), len(shape_index)))
+            # The shapes share the same binning: their sums of weights are computed in a single call
+            sumw[parent_index[parent_cat], tau21_index[tau21], region_index[region], [shape_index[name] for name in names]] = \
+                np.stack([hist.values() for hist in shape_histograms.values()]).sum(axis=1)
 
-    passfail_ratio = defaultdict(lambda: defaultdict(dict))
-    parent_categories = set(['-'.join(cat.split("-")[:-1]) for cat in datacards.keys()])
-    
-    for parent_cat in parent_categories:
-        for tau21 in datacards[f"{parent_cat}-pass"].keys():
-            sumw_pass = sumw_percat[f"{parent_cat}-pass"][tau21]
-            sumw_fail = sumw_percat[f"{parent_cat}-fail"][tau21]
-            for flavor in sumw_pass.keys():
-                passfail_ratio[parent_cat][tau21][flavor] = float(sumw_pass[flavor] / sumw_fail[flavor])
+    # The ratios of all the parent categories, tau21 cuts and shapes are computed with a single division
+    ratio = sumw[:, :, region_index["pass"], :] / sumw[:, :, region_index["fail"], :]
 
-    return dict(passfail_ratio)
+    return {
+        (parent_cat, tau21): dict(zip(shape_index, ratio[i, j].tolist()))
+        for parent_cat, i in parent_index.items() for tau21, j in tau21_index.items()
+    }
 
 def add_Madgraph_systematic(histogram_logsumSVmass_tau21):
     """Function to add the Madgraph systematic uncertainty to the histogram."""
@@ -302,13 +313,16 @@ def add_Madgraph_systematic(histogram_logsumSVmass_tau21):
         down_int = down_vals.sum()
         print(f"nom_int: {nom_int}\nup_int: {up_int}\ndown_int: {down_int}")
 
-def add_Madgraph_systematic_1d(histo_1d, cat):
+def add_Madgraph_systematic_1d(histo_1d, cat, verbose=False):
+    # The detailed printout is called for each category and tau21 cut: it is only enabled in verbose mode
     qcd_samples = [s for s in histo_1d.keys() if s.startswith("QCD_")]
-    print(f"QCD samples: {qcd_samples}\n")
     flavors = {s.split("__")[1].split("_")[-1] for s in qcd_samples if "__" in s and len(s.split("__")[1].split("_")) >= 2}
-    print(f"flavors: {flavors}\n")
+    if verbose:
+        print(f"QCD samples: {qcd_samples}\n")
+        print(f"flavors: {flavors}\n")
     for flav in flavors:
-        print(f"\nProcessing flavor: {flav}")
+        if verbose:
+            print(f"\nProcessing flavor: {flav}")
         mu_name = f"QCD_MuEnriched__QCD_MuEnriched_{flav}"
         mg_name = f"QCD_Madgraph__QCD_Madgraph_{flav}"
         if mu_name not in histo_1d or mg_name not in histo_1d:
@@ -333,7 +347,8 @@ def add_Madgraph_systematic_1d(histo_1d, cat):
         ratio[mask] = mg_vals_scaled[mask] / mu_vals[mask]
         ratio = np.clip(ratio, 0, 2)
         for dataset, h_mu in mu_datasets.items():
-            print(f"\ndataset: {dataset}")
+            if verbose:
+                print(f"\ndataset: {dataset}")
             current_vars = list(h_mu.axes["variation"])
             # print(f"current_vars: {current_vars}")
             new_vars = current_vars + [f"QCD_MuEnriched_ratioUp", f"QCD_MuEnriched_ratioDown"]
@@ -364,7 +379,8 @@ def add_Madgraph_systematic_1d(histo_1d, cat):
             nominal_integral = new_hist.view(flow=True)[cat_idx, nom_idx, :].sum().value
             up_integral = new_hist.view(flow=True)[cat_idx, up_idx, :].sum().value
             down_integral = new_hist.view(flow=True)[cat_idx, down_idx, :].sum().value
-            print(f"nominal_integral = {nominal_integral}\nup_integral = {up_integral}\ndown_integral = {down_integral}")
+            if verbose:
+                print(f"nominal_integral = {nominal_integral}\nup_integral = {up_integral}\ndown_integral = {down_integral}")
             if up_integral > 0:
                 up_factor = nominal_integral / up_integral
                 new_hist.view(flow=True)[cat_idx, up_idx, :] *= up_factor
@@ -480,14 +496,16 @@ def plot_nom_vs_up_vs_down(nom_total, up_total, down_total, flavour, tau21_cut=0
 def get_1d_histogram(h2d_dict, tau21_cut):
     """Function to get the 1D histogram from the 2D histogram by integrating over the axis corresponding to tau21."""
     h1d_dict = {}
+    # All the histograms of the variable share the same tau21 axis: the last bin is found once,
+    # as the number of bins with upper edge not exceeding the cut
+    ax_tau21 = next(iter(next(iter(h2d_dict.values())).values())).axes["FatJetGood.tau21"]
+    bin_stop = int(np.searchsorted(ax_tau21.edges[1:], tau21_cut, side='right'))
     for proc, ds_dict in h2d_dict.items():
         print(f"\nProcessing {proc}...")
         print(f"{ds_dict.keys()}\n")
         h1d_dict[proc] = {}
         for ds, histo2d in ds_dict.items():
             # print(f"histo2d.axes = {histo2d.axes}\n")
-            ax_tau21 = histo2d.axes["FatJetGood.tau21"]
-            bin_stop = next(i for i, edge in enumerate(ax_tau21.edges[1:]) if edge > tau21_cut)
             histo_cut = histo2d.integrate(ax_tau21.name, 0, bin_stop)
             h1d_dict[proc][ds] = histo_cut
     # print(f"{h1d_dict.keys()}\n")
@@ -637,209 +655,290 @@ def print_report(successful_categories, failed_categories):
     print(f"✅  Successful: {len(successful_categories)} / {ncat}")
     print(f"❌  Failed: {len(failed_categories)} / {ncat}")
 
+def dump_datacard(datacard, kwargs, year, category):
+    """Dump a datacard and return whether it succeeded, with the entry for the summary report."""
+    try:
+        datacard.dump(**kwargs)
+        return True, {"year": year, "category": category, "folder": kwargs["directory"]}
+    except Exception as e:
+        print(f"Failed to create datacard for Year: {year}, Category: {category}")
+        print(str(e))
+        return False, {"year": year, "category": category, "error": str(e)}
+
+def write_combined_datacard(datacards, passfail_ratio, directory, label):
+    """Combine the pass and fail datacards in `directory` and save the pass/fail ratio next to them."""
+    print(f"\nCreating combined datacard for {label}")
+    combine_datacards(
+        datacards={f"{region}/datacard.txt": datacard for region, datacard in datacards.items()},
+        directory=directory
+    )
+    # Save pass/fail ratio to a YAML file
+    filename = directory / "passfail_ratio.yaml"
+    print(f"Saving pass/fail ratio to {filename}")
+    with open(filename, "w") as f:
+        yaml.dump({"passfail_ratio" : passfail_ratio}, f, Dumper=SafeDumper, indent=4)
+    print(f"Combined datacard saved in {directory}")
+
+# Upper cuts on tau21 defining the fit templates
+TAU21_CUTS = (0.2, 0.25, 0.3, 0.35, 0.4)
+
 # Helper function to extract the tau21 string for directory naming
 get_tau21_str = lambda x: f"tau21_{x:.2f}".replace('.', 'p')
+TAU21_STRS = {tau21: get_tau21_str(tau21) for tau21 in TAU21_CUTS}
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Create combine datacards from pocketcoffea output")
-    parser.add_argument("input_file", help="Path to the pocketcoffea output .coffea file")
-    parser.add_argument("--output-dir", "-o", default=None, help="Output directory for datacards")
-    parser.add_argument("--variable", default="FatJetGood_logsumcorrSVmass_tau21", help="Variable to use for the fit")
-    parser.add_argument("--years", nargs="+", default=["2022_preEE", "2022_postEE", "2023_preBPix", "2023_postBPix"], 
-                       help="Years to include in the analysis")
-    parser.add_argument("--verbose", "-v", action="store_true", default=False, help="Enable verbose output")
-    args = parser.parse_args()
-    
+def load_inputs(args):
+    """Load the coffea output and prepare the inputs shared by all the years.
+    Returns None if there are no categories to create datacards for."""
     # Load the coffea output
     print(f"Loading coffea output from {args.input_file}\n")
     output = load(args.input_file)
     
     # Extract histograms, cutflow, and metadata
-    histograms = output["variables"]
-    # hist_tau21 = histograms["FatJetGood_tau21"]
+    # hist_tau21 = output["variables"]["FatJetGood_tau21"]
     # plot_tau21_mu_vs_mg(hist_tau21, cat="pt300msd80to170")
+    print(f"Available histograms: {list(output['variables'].keys())}\n")
+    # Only the histogram of the fit variable is kept: the references to the rest of the output are dropped,
+    # so that the other histograms are released before the datacards are created
+    histograms = {args.variable: output["variables"][args.variable]}
     cutflow = output["cutflow"]
     datasets_metadata = output["datasets_metadata"]
+    del output
     categories = [cat for cat in cutflow.keys() if cat.startswith('msd')]
+    # Parent category (without pass/fail) and region of each category, computed once for all the years
+    category_parts = {}
+    for cat in categories:
+        parent_category, _, region = cat.rpartition("-")
+        category_parts[cat] = (parent_category, region)
+    parent_categories = sorted({parent_category for parent_category, _ in category_parts.values()})
     
     # Categorize samples
     samples = categorize_samples(cutflow)
     print(f"\nFound samples: {samples}")
-    print(f"Available histograms: {list(histograms.keys())}\n")
 
+    if not categories:
+        print("No categories starting with 'msd' found in the cutflow: no datacards to create.")
+        return None
+
+    # Create output directory, shared by all the years
+    output_dir = Path(args.output_dir or Path(args.input_file).parent / "datacards")
+    output_dir.mkdir(exist_ok=True)
+
+    # Get the 1D histograms by integrating over tau21 axis with a specific cut: tau21 < tau21_cut.
+    # They do not depend on the year and category, so they are computed once for each tau21 cut
+    histos_1d_by_tau21 = {tau21: get_1d_histogram(histograms[args.variable], tau21) for tau21 in TAU21_CUTS}
+
+    return {
+        "histograms": histograms,
+        "cutflow": cutflow,
+        "datasets_metadata": datasets_metadata,
+        "samples": samples,
+        "categories": categories,
+        "category_parts": category_parts,
+        "parent_categories": parent_categories,
+        "histos_1d_by_tau21": histos_1d_by_tau21,
+        "output_dir": output_dir,
+    }
+
+
+def create_datacards_year(year, args, histograms, cutflow, datasets_metadata, samples, categories,
+                          category_parts, parent_categories, histos_1d_by_tau21, output_dir):
+    """Create, dump and combine the datacards of a single year.
+    Returns the lists of successful and failed categories for the summary report."""
     successful_categories = []
     failed_categories = []
 
-    for year in args.years:
-        # Define processes and systematics
-        mc_processes, data_processes = define_processes(samples, [year])
-        print(f"MC processes: {mc_processes.items()}")
-        print(f"DATA processes: {data_processes.items()}\n")
-        
-        # Update process samples based on what we found
-        for process_name, process in mc_processes.items():
-            process.samples = samples[process_name]
-        
-        for process_name, process in data_processes.items():
-            process.samples = samples[process_name]
-
-        # Add the variation QCD_Madgraph/QCD_MuEnriched to the Hist
-        # add_Madgraph_systematic(histograms[args.variable])
-        
-        systematics = define_systematics([year], [p_name for p_name, p in mc_processes.items()])
-        print(f"systematics: {systematics}\n")
-        
-        # Create output directory
-        if args.output_dir is None:
-            args.output_dir = str(Path(args.input_file).parent / "datacards")
-        output_dir = Path(args.output_dir)
-        output_dir.mkdir(exist_ok=True)
-        
-        # Dictionary to store all datacards for combination
-        all_datacards = defaultdict(dict)
-        # Additional datacards using MC reweighted to data for tau21 < 0.30
-        all_datacards_reweight = defaultdict(dict)
-        
-        # Create datacards for each combination
-        for cat in categories:
-            print(f"\ncategory: {cat}")
-
-            for tau21 in [0.2, 0.25, 0.3, 0.35, 0.4]:
+    # Define processes and systematics
+    mc_processes, data_processes = define_processes(samples, [year])
+    print(f"MC processes: {mc_processes.items()}")
+    print(f"DATA processes: {data_processes.items()}\n")
+    
+    # Update process samples based on what we found
+    for process_name, process in mc_processes.items():
+        process.samples = samples[process_name]
+    
+    for process_name, process in data_processes.items():
+        process.samples = samples[process_name]
+
+    # Add the variation QCD_Madgraph/QCD_MuEnriched to the Hist
+    # add_Madgraph_systematic(histograms[args.variable])
+    
+    systematics = define_systematics([year], [p_name for p_name, p in mc_processes.items()])
+    print(f"systematics: {systematics}\n")
+    
+    # Dictionary to store all datacards for combination
+    all_datacards = defaultdict(dict)
+    # Additional datacards using MC reweighted to data for tau21 < 0.30
+    all_datacards_reweight = defaultdict(dict)
+    # The reweighted 1D histograms depend only on the parent category: they are shared by its pass and fail categories
+    histos_1d_rew_by_parent = {}
+    
+    # Create datacards for each combination
+    for cat in categories:
+        print(f"\ncategory: {cat}")
+
+        for tau21 in TAU21_CUTS:
+            if args.verbose:
                 print(f"\n\nCreating datacard: Year: {year}\tCategory: {cat}\ttau21 < {tau21}")
-                
-                # Get the 1D histogram by integrating over tau21 axis with a specific cut: tau21 < tau21_cut
-                histo_1d = get_1d_histogram(histograms[args.variable], tau21)
-                # Add the variation QCD_Madgraph/QCD_MuEnriched to the Hist
-                add_Madgraph_systematic_1d(histo_1d, cat)
+            
+            # Copy the dictionary structure of the 1D histograms: add_Madgraph_systematic_1d replaces
+            # the QCD_MuEnriched entries for this category, the histograms themselves are shared
+            histo_1d = {proc: dict(ds_dict) for proc, ds_dict in histos_1d_by_tau21[tau21].items()}
+            # Add the variation QCD_Madgraph/QCD_MuEnriched to the Hist
+            add_Madgraph_systematic_1d(histo_1d, cat, verbose=args.verbose)
+            if args.verbose:
                 print("\n")
-                # Create datacard
-                datacard = DatacardMutag(
-                    histograms=histo_1d,
+            # Create datacard
+            datacard = DatacardMutag(
+                histograms=histo_1d,
+                datasets_metadata=datasets_metadata,
+                cutflow=cutflow,
+                years=[year],
+                mc_processes=mc_processes,
+                data_processes=data_processes,
+                systematics=systematics,
+                category=cat,  # Category string matching the multicuts structure
+                verbose=args.verbose
+            )
+            
+            # Store for combination between pass and fail regions
+            all_datacards[cat][tau21] = datacard
+
+            # For tau21 < 0.30, also create a datacard where MC
+            # templates are reweighted to data in the inclusive
+            # (pass+fail) region for the corresponding parent
+            # category, to define an external systematic.
+            if abs(tau21 - 0.3) < 1e-6:
+                if args.verbose:
+                    print(f"\n\nCreating datacard: Year: {year}\tCategory: {cat}\ttau21 < {tau21} reweighed")
+                parent_category = category_parts[cat][0]
+                if parent_category not in histos_1d_rew_by_parent:
+                    histos_1d_rew_by_parent[parent_category] = get_1d_histogram_reweighed(
+                        histograms[args.variable], tau21, samples, year, parent_category
+                    )
+                histo_1d_rew = {proc: dict(ds_dict) for proc, ds_dict in histos_1d_rew_by_parent[parent_category].items()}
+                # Add the variation QCD_Madgraph/QCD_MuEnriched to the Hist
+                add_Madgraph_systematic_1d(histo_1d_rew, cat, verbose=args.verbose)
+                if args.verbose:
+                    print("\n")
+                datacard_rew = DatacardMutag(
+                    histograms=histo_1d_rew,
                     datasets_metadata=datasets_metadata,
                     cutflow=cutflow,
                     years=[year],
                     mc_processes=mc_processes,
                     data_processes=data_processes,
                     systematics=systematics,
-                    category=cat,  # Category string matching the multicuts structure
-                    verbose=args.verbose
+                    category=cat,
+                    verbose=args.verbose,
                 )
-                
-                # Store for combination between pass and fail regions
-                all_datacards[cat][tau21] = datacard
-
-                # For tau21 < 0.30, also create a datacard where MC
-                # templates are reweighted to data in the inclusive
-                # (pass+fail) region for the corresponding parent
-                # category, to define an external systematic.
-                if abs(tau21 - 0.3) < 1e-6:
-                    print(f"\n\nCreating datacard: Year: {year}\tCategory: {cat}\ttau21 < {tau21} reweighed")
-                    parent_category = "-".join(cat.split("-")[:-1])
-                    histo_1d_rew = get_1d_histogram_reweighed(
-                        histograms[args.variable], tau21, samples, year, parent_category
-                    )
-                    # Add the variation QCD_Madgraph/QCD_MuEnriched to the Hist
-                    add_Madgraph_systematic_1d(histo_1d_rew, cat)
-                    print("\n")
-                    datacard_rew = DatacardMutag(
-                        histograms=histo_1d_rew,
-                        datasets_metadata=datasets_metadata,
-                        cutflow=cutflow,
-                        years=[year],
-                        mc_processes=mc_processes,
-                        data_processes=data_processes,
-                        systematics=systematics,
-                        category=cat,
-                        verbose=args.verbose,
-                    )
-                    all_datacards_reweight[cat][tau21] = datacard_rew
-                
-        passfail_ratio = get_passfail_ratio(all_datacards)
-
-        # Loop over categories again to dump datacards modified with pass/fail ratios
-        parent_categories = set()
-        for cat in categories:
-            for tau21 in [0.2, 0.25, 0.3, 0.35, 0.4]:
-                # Extract parent category (without pass/fail)
-                parent_category = '-'.join(cat.split("-")[:-1])
-                parent_categories.add(parent_category)
-                region = cat.split("-")[-1]
-                # Create directory for this category
-                tau21_str = get_tau21_str(tau21)
-                category_dir = output_dir / year / parent_category / tau21_str / region
-                category_dir.mkdir(parents=True, exist_ok=True)
-                datacard = all_datacards[cat][tau21]
-
-                # Modify action of rateParam for fail regions by passing the passfail_ratio argument
-                if cat.endswith("-pass"):
-                    kwargs = {"directory" : str(category_dir)}
-                elif cat.endswith("-fail"):
-                    parent_cat = '-'.join(cat.split("-")[:-1])
-                    kwargs = {"directory" : str(category_dir), "passfail_ratio" : passfail_ratio[parent_cat][tau21]}
-                try:
-                    datacard.dump(**kwargs)
-                    successful_categories.append({"year": year, "category": cat, "folder": str(category_dir)})
-                except Exception as e:
-                    print(f"Failed to create datacard for Year: {year}, Category: {cat}")
-                    print(str(e))
-                    failed_categories.append({"year": year, "category": cat, "error": str(e)})
-
-                # For tau21 < 0.30, also dump the reweighted datacards
-                if abs(tau21 - 0.3) < 1e-6 and cat in all_datacards_reweight and tau21 in all_datacards_reweight[cat]:
-                    reweight_tau21_str = f"{tau21_str}_reweight"
-                    reweight_category_dir = output_dir / year / parent_category / reweight_tau21_str / region
-                    reweight_category_dir.mkdir(parents=True, exist_ok=True)
-                    datacard_rew = all_datacards_reweight[cat][tau21]
-
-                    if cat.endswith("-pass"):
-                        kwargs_rew = {"directory": str(reweight_category_dir)}
-                    elif cat.endswith("-fail"):
-                        parent_cat = '-'.join(cat.split("-")[:-1])
-                        kwargs_rew = {"directory": str(reweight_category_dir), "passfail_ratio": passfail_ratio[parent_cat][tau21]}
-                    else:
-                        kwargs_rew = {"directory": str(reweight_category_dir)}
-
-                    try:
-                        datacard_rew.dump(**kwargs_rew)
-                        successful_categories.append({"year": year, "category": f"{cat}_reweight", "folder": str(reweight_category_dir)})
-                    except Exception as e:
-                        print(f"Failed to create reweighted datacard for Year: {year}, Category: {cat}")
-                        print(str(e))
-                        failed_categories.append({"year": year, "category": f"{cat}_reweight", "error": str(e)})
-
-        # Create combined datacard for pass+fail regions, for each parent category
-        for parent_cat in parent_categories:
-            for tau21 in [0.2, 0.25, 0.3, 0.35, 0.4]:
-                print(f"\nCreating combined datacard for category: {parent_cat} with tau21 < {tau21} (pass + fail)")
-                tau21_str = get_tau21_str(tau21)
-                directory = output_dir / year / parent_cat / tau21_str
-                combine_datacards(
-                    datacards={f"{region}/datacard.txt": all_datacards[f"{parent_cat}-{region}"][tau21] for region in ["pass", "fail"]},
-                    directory=directory
-                )
-                # Save pass/fail ratio to a YAML file
-                filename = directory / "passfail_ratio.yaml"
-                print(f"Saving pass/fail ratio to {filename}")
-                with open(filename, "w") as f:
-                    yaml.dump({"passfail_ratio" : passfail_ratio[parent_cat][tau21]}, f, indent=4)
-
-                print(f"Combined datacard saved in {directory}")
-
-                # For tau21 < 0.30, also create the combined reweighted datacard
-                if abs(tau21 - 0.3) < 1e-6:
-                    reweight_tau21_str = f"{tau21_str}_reweight"
-                    directory_rew = output_dir / year / parent_cat / reweight_tau21_str
-                    print(f"\nCreating combined reweighted datacard for category: {parent_cat} with tau21 < {tau21} (pass + fail)")
-                    combine_datacards(
-                        datacards={f"{region}/datacard.txt": all_datacards_reweight[f"{parent_cat}-{region}"][tau21] for region in ["pass", "fail"]},
-                        directory=directory_rew,
-                    )
-                    filename_rew = directory_rew / "passfail_ratio.yaml"
-                    print(f"Saving pass/fail ratio to {filename_rew}")
-                    with open(filename_rew, "w") as f:
-                        yaml.dump({"passfail_ratio": passfail_ratio[parent_cat][tau21]}, f, indent=4)
-                    print(f"Combined reweighted datacard saved in {directory_rew}")
+                all_datacards_reweight[cat][tau21] = datacard_rew
+            
+    passfail_ratio = get_passfail_ratio(all_datacards, parent_categories)
+
+    # Loop over categories again to collect the dumps of the datacards modified with pass/fail ratios
+    dump_tasks = []
+    for cat in categories:
+        parent_category, region = category_parts[cat]
+        for tau21 in TAU21_CUTS:
+            # Directory for this category: it is created by DatacardMutag.dump, no need to create it here
+            tau21_str = TAU21_STRS[tau21]
+            category_dir = output_dir / year / parent_category / tau21_str / region
+
+            # Modify action of rateParam for fail regions by passing the passfail_ratio argument
+            kwargs = {"directory" : str(category_dir)}
+            if cat.endswith("-fail"):
+                kwargs["passfail_ratio"] = passfail_ratio[parent_category, tau21]
+            dump_tasks.append((all_datacards[cat][tau21], kwargs, year, cat))
+
+            # For tau21 < 0.30, also dump the reweighted datacards
+            if abs(tau21 - 0.3) < 1e-6 and cat in all_datacards_reweight and tau21 in all_datacards_reweight[cat]:
+                reweight_tau21_str = f"{tau21_str}_reweight"
+                reweight_category_dir = output_dir / year / parent_category / reweight_tau21_str / region
+
+                kwargs_rew = {"directory": str(reweight_category_dir)}
+                if cat.endswith("-fail"):
+                    kwargs_rew["passfail_ratio"] = passfail_ratio[parent_category, tau21]
+                dump_tasks.append((all_datacards_reweight[cat][tau21], kwargs_rew, year, f"{cat}_reweight"))
+
+    # Each datacard is written in its own directory: the dumps are independent and run concurrently.
+    # Threads are used since the datacards share the full histogram dictionary, which is not copied
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for success, d_cat in executor.map(lambda task: dump_datacard(*task), dump_tasks):
+            if success:
+                successful_categories.append(d_cat)
+            else:
+                failed_categories.append(d_cat)
+
+    # Create combined datacard for pass+fail regions, for each parent category
+    combine_tasks = []
+    for parent_cat in parent_categories:
+        for tau21 in TAU21_CUTS:
+            tau21_str = TAU21_STRS[tau21]
+            combine_tasks.append((
+                {region: all_datacards[f"{parent_cat}-{region}"][tau21] for region in ["pass", "fail"]},
+                passfail_ratio[parent_cat, tau21],
+                output_dir / year / parent_cat / tau21_str,
+                f"category: {parent_cat} with tau21 < {tau21} (pass + fail)",
+            ))
+            # For tau21 < 0.30, also create the combined reweighted datacard
+            if abs(tau21 - 0.3) < 1e-6:
+                combine_tasks.append((
+                    {region: all_datacards_reweight[f"{parent_cat}-{region}"][tau21] for region in ["pass", "fail"]},
+                    passfail_ratio[parent_cat, tau21],
+                    output_dir / year / parent_cat / f"{tau21_str}_reweight",
+                    f"reweighted category: {parent_cat} with tau21 < {tau21} (pass + fail)",
+                ))
+
+    # The combined datacards are written in separate directories: the writes run concurrently
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(lambda task: write_combined_datacard(*task), combine_tasks))
+
+    return successful_categories, failed_categories
+
+
+# Inputs loaded once by each worker process, when the years are processed in parallel
+_worker_inputs = None
+
+def _init_worker(args):
+    global _worker_inputs
+    _worker_inputs = load_inputs(args)
+
+def _create_datacards_year_worker(year, args):
+    if _worker_inputs is None:
+        return [], []
+    return create_datacards_year(year, args, **_worker_inputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create combine datacards from pocketcoffea output")
+    parser.add_argument("input_file", help="Path to the pocketcoffea output .coffea file")
+    parser.add_argument("--output-dir", "-o", default=None, help="Output directory for datacards")
+    parser.add_argument("--variable", default="FatJetGood_logsumcorrSVmass_tau21", help="Variable to use for the fit")
+    parser.add_argument("--years", nargs="+", default=["2022_preEE", "2022_postEE", "2023_preBPix", "2023_postBPix"], 
+                       help="Years to include in the analysis")
+    parser.add_argument("--verbose", "-v", action="store_true", default=False, help="Enable verbose output")
+    parser.add_argument("--workers", "-j", type=int, default=None,
+                       help="Number of threads used to dump the datacards. By default, it is chosen by ThreadPoolExecutor.")
+    parser.add_argument("--processes", "-p", type=int, default=1,
+                       help="Number of years processed in parallel. Each process loads the coffea output. By default, the years are processed sequentially.")
+    args = parser.parse_args()
+
+    if args.processes > 1:
+        # Each worker loads the coffea output once, in the initializer, instead of receiving the histograms
+        with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker, initargs=(args,)) as executor:
+            results = list(executor.map(_create_datacards_year_worker, args.years, [args] * len(args.years)))
+    else:
+        inputs = load_inputs(args)
+        if inputs is None:
+            return
+        results = [create_datacards_year(year, args, **inputs) for year in args.years]
+
+    successful_categories = []
+    failed_categories = []
+    for successful_year, failed_year in results:
+        successful_categories.extend(successful_year)
+        failed_categories.extend(failed_year)
 
     # Print summary report
     print_report(successful_categories, failed_categories)
@@ -98,6 +98,21 @@ class DatacardMutag(Datacard):
 
         return content
 
+    def create_shape_histogram_dict(self, is_data: bool = False) -> dict:
+        """
+        Create the dictionary of shape histograms, cached on the datacard.
+        The shapes are used both to compute the pass/fail ratios and to dump the datacard,
+        so they are built only once for data and once for MC.
+
+        :param is_data: Whether to create the shapes of the data processes.
+        :type is_data: bool, optional
+        """
+        if not hasattr(self, "_shape_histograms"):
+            self._shape_histograms = {}
+        if is_data not in self._shape_histograms:
+            self._shape_histograms[is_data] = super().create_shape_histogram_dict(is_data=is_data)
+        return self._shape_histograms[is_data]
+
     def dump(
         self,
         directory: os.PathLike,
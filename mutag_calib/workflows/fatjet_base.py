@@ -107,7 +107,7 @@ class fatjetBaseProcessor(BaseProcessorABC):
         fatjet_fields = {
             "tau21" : self.events.FatJetGood.tau2 / self.events.FatJetGood.tau1,
             #"nSubJet" : ak.count(events.FatJetGood.subjets.pt, axis=2),
-            "nMuonGoodMatchedToFatJetGood" : ak.count(self.events["MuonGoodMatchedToFatJetGood"].pt, axis=2),
+            "nMuonGoodMatchedToFatJetGood" : ak.num(self.events["MuonGoodMatchedToFatJetGood"], axis=2),
             #"nMuonGoodMatchedToSubJet" : ak.count(self.events["MuonGoodMatchedToSubJet"].pt, axis=2),
             #"nMuonGoodMatchedUniquelyToSubJet" : ak.count(self.events["MuonGoodMatchedUniquelyToSubJet"].pt, axis=2)
         }
@@ -141,13 +141,15 @@ class fatjetBaseProcessor(BaseProcessorABC):
         # Xbb = self.events.FatJetGood.particleNetMD_Xbb
         # Xcc = self.events.FatJetGood.particleNetMD_Xcc
         # QCD = self.events.FatJetGood.particleNetMD_QCD
-        sumcorrSVmass, logsumcorrSVmass = get_sumcorrmass(self.events.SVMatchedToFatJetGood)
+        # The number of SVs matched to each fatjet is computed once and shared
+        nSVMatchedToFatJetGood = ak.num(self.events.SVMatchedToFatJetGood, axis=2)
+        sumcorrSVmass, logsumcorrSVmass = get_sumcorrmass(self.events.SVMatchedToFatJetGood, nsv=nSVMatchedToFatJetGood)
         # Order SV by dxySig and compute the leading SV mass and its log
         #index_max_pt = ak.argsort(self.events.SVMatchedToFatJetGood.pt, ascending=False)
         index_max_dxySig = ak.argsort(self.events.SVMatchedToFatJetGood.dxySig, ascending=False)
         sv1mass, logsv1mass = get_sv1mass(self.events.SVMatchedToFatJetGood[index_max_dxySig])
         fatjet_fields = {
-            "nSVMatchedToFatJetGood": ak.count(self.events["SVMatchedToFatJetGood"].pt, axis=2),
+            "nSVMatchedToFatJetGood": nSVMatchedToFatJetGood,
             # "particleNetMD_Xbb_QCD" : Xbb / (Xbb + QCD),
             # "particleNetMD_Xcc_QCD" : Xcc / (Xcc + QCD),
             "sumcorrSVmass" : sumcorrSVmass,
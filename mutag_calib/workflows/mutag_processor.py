@@ -1,8 +1,8 @@
 from collections import defaultdict
 import awkward as ak
-import correctionlib
 
 from mutag_calib.workflows.fatjet_base import fatjetBaseProcessor
+from mutag_calib.configs.fatjet_base.custom.scale_factors import load_correction_set, get_corrector
 from pocket_coffea.utils.configurator import Configurator
 from mutag_calib.lib.sv import *
 
@@ -29,17 +29,16 @@ class mutagAnalysisProcessor(fatjetBaseProcessor):
         '''Correction of jets observable by a 3D reweighting based on (pT, eta, tau21).
         The function stores the nominal, up and down weights in self.weight_3d,
         where the up/down variations are computed considering the statistical uncertainty on data and MC.'''
-        cset = correctionlib.CorrectionSet.from_file(self.params["ptetatau21_reweighting"][self._year]["file"])
-        assert len(list(cset.keys())) == 1, "The correction file should contain only one correction."
-        key = list(cset.keys())[0]
-        corr = cset[key]
+        file = self.params["ptetatau21_reweighting"][self._year]["file"]
+        assert len(list(load_correction_set(file).keys())) == 1, "The correction file should contain only one correction."
+        corr = get_corrector(file)
 
         cat = self.params["ptetatau21_reweighting"][self._year]["category"]
         nfatjet  = ak.num(self.events.FatJetGood.pt)
-        pos = ak.flatten(self.events.FatJetGood.pos)
-        pt = ak.flatten(self.events.FatJetGood.pt)
-        eta = ak.flatten(self.events.FatJetGood.eta)
-        tau21 = ak.flatten(self.events.FatJetGood.tau21)
+        pos = ak.to_numpy(ak.flatten(self.events.FatJetGood.pos))
+        pt = ak.to_numpy(ak.flatten(self.events.FatJetGood.pt))
+        eta = ak.to_numpy(ak.flatten(self.events.FatJetGood.eta))
+        tau21 = ak.to_numpy(ak.flatten(self.events.FatJetGood.tau21))
 
         weight_dict = {"all" : {}, "1" : {}, "2" : {}}
         for var in ["nominal", "statUp", "statDown"]: